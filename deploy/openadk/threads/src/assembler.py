@@ -2,20 +2,85 @@
 
 import argparse
 import logging
-from assembler import Assembler
+import os
+import sys
+import time
+from assembler import Assembler, IncrementalAssembler, ObjectAssembler, StreamingAssembler, profile, trace
+from assembler.encoder import ENCODING_CACHE
+from assembler.instruction_encodings import Encoding
+from assembler.output import FORMATS
 
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
+def watch(args):
+    asm = IncrementalAssembler()
+    mtime = None
+    while True:
+        current = os.stat(args.input).st_mtime_ns
+        if current == mtime:
+            time.sleep(args.interval)
+            continue
+        mtime = current
+        try:
+            asm.assemble(open(args.input).read())
+        except SystemExit:
+            # errors are already logged, wait for the next save
+            continue
+        with open(args.output, "wb") as output:
+            asm.write_encoded(output)
+        logger.warning("Assembled %s, %d bytes, reused %d of %d instructions", args.input, len(asm.encoded), asm.reused, sum(map(len, asm.current.values())))
+
+def write_output(args, encoded: bytes, labels: dict[str, int]):
+    name = args.name or os.path.splitext(os.path.basename(args.input))[0]
+    with open(args.output, "wb") as output:
+        FORMATS[args.format](output, memoryview(encoded), labels, name)
+
 def main(args):
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
+        trace.enable()
+    if args.trace:
+        trace.enable(open(args.trace, "w"))
+    if args.profile:
+        profile.enable()
+    Encoding.reference = args.reference
+    if args.watch:
+        watch(args)
+        return
+    if args.stream:
+        with open(args.input) as source, open(args.output, "wb") as output:
+            StreamingAssembler(output).assemble(source)
+        return
     assembly = open(args.input).read()
-    asm = Assembler()
+    name = os.path.basename(args.input)
+    # tracing and profiling need a real run, so skip the cache for them
+    cache = None
+    if args.cache_dir and not (args.debug or args.trace or args.profile):
+        # hashlib and tempfile would otherwise slow down every startup
+        from assembler.cache import AssemblyCache, DEFAULT_MAX_SIZE, cache_key
+        cache = AssemblyCache(args.cache_dir, args.cache_size or DEFAULT_MAX_SIZE)
+        options = {"reference": args.reference}
+        if args.object:
+            # the object records the name of its source
+            options["object"] = name
+        key = cache_key(assembly, options)
+        cached = cache.get(key)
+        if cached is not None:
+            encoded, labels = cached
+            if args.output:
+                write_output(args, encoded, labels)
+            return
+    asm = ObjectAssembler() if args.object else Assembler()
     asm.assemble(assembly)
     asm.print_instructions()
+    logger.debug("%s", ENCODING_CACHE)
+    # objects are stored like images
+    encoded = asm.to_object(name).dumps() if args.object else asm.encoded
+    if cache is not None:
+        cache.put(key, encoded, asm.labels)
     if args.output:
-        open(args.output, "wb").write(asm.encoded)
+        write_output(args, encoded, asm.labels)
 
 
 if __name__ == '__main__':
@@ -23,5 +88,31 @@ if __name__ == '__main__':
     parser.add_argument("-o", "--output", help="Output file")
     parser.add_argument("input", help="Input file")
     parser.add_argument("-d", "--debug", action="store_true", default=False, help="Enable debug output")
+    parser.add_argument("-s", "--stream", action="store_true", default=False, help="Assemble line by line and write the output directly, requires --output")
+    parser.add_argument("-w", "--watch", action="store_true", default=False, help="Reassemble incrementally whenever the input changes, requires --output")
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between checks for changes in watch mode")
+    parser.add_argument("-c", "--object", action="store_true", default=False, help="Write a relocatable object for link.py instead of an image")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="bin", help="Raw image, C header, ELF object with a .minim.text section, Intel HEX or S-records")
+    parser.add_argument("--name", help="Name of the array and prefix of the label symbols, default the input file name")
+    parser.add_argument("--trace", help="Write a trace of all match attempts as JSON lines to this file")
+    parser.add_argument("--profile", action="store_true", default=False, help="Print the time per phase, match attempts per instruction and failed matches per encoding to stderr")
+    parser.add_argument("--cache-dir", help="Reuse assembled images from this directory if the source and assembler are unchanged")
+    parser.add_argument("--cache-size", type=int, help="Maximum size of the cache directory in bytes, default 64 MiB")
+    parser.add_argument("--reference", action="store_true", default=False, help="Match and encode with the generic reference implementation instead of the compiled functions")
     args = parser.parse_args()
-    main(args)
+    if args.stream and not args.output:
+        parser.error("--stream requires --output")
+    if args.watch and not args.output:
+        parser.error("--watch requires --output")
+    if args.object and (args.stream or args.watch):
+        parser.error("--object can't be combined with --stream or --watch")
+    if args.format != "bin" and (args.object or args.stream or args.watch):
+        parser.error("--format only applies to images, not to --object, --stream or --watch")
+    try:
+        main(args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        trace.disable()
+        if args.profile:
+            print(profile.disable().table(), file=sys.stderr)
@@ -1,25 +1,38 @@
 import logging
+import struct
+import time
+from . import profile, trace
 from .arguments import Argument
-from .encoder import Encoder
+from .encoder import Encoder, Padding
 from .instructions import BRANCH_RELATIVE_INSTRUCTIONS
 from .modifiers import parse_modifiers
 
 logger = logging.getLogger(__name__)
 
+# little endian packing of core (2 byte) and extended (4 byte) instructions
+PACK_FORMATS = {
+    2: struct.Struct("<H"),
+    4: struct.Struct("<I"),
+    }
+
 class Assembler:
     cursor: int
     labels: dict[str, int]
+    label_positions: dict[str, int]
     instructions: list[Encoder]
-    encoded: bytes
+    encoded: memoryview
 
     def __init__(self):
         pass
 
     def align(self):
         assert self.cursor & 1 == 0
+        # align all labels to 4 bytes to make jumps easyer
+        # the padding is only emitted if needed after the layout is final
+        padding = Padding(self.cursor)
+        self.instructions.append(padding)
         if self.cursor & 2 != 0:
-            # align all labels to 4 bytes to make jumps easyer
-            self.process_line("NOP")
+            self.cursor += padding.size
 
 
     def process_label(self, label: str):
@@ -27,6 +40,7 @@ class Assembler:
             logger.critical("Label %s already defined at 0x%x", label, self.labels[label])
             exit()
         self.labels[label] = self.cursor
+        self.label_positions[label] = len(self.instructions)
 
     def process_command(self, command: str, args: list[str]):
         match command:
@@ -49,50 +63,120 @@ class Assembler:
             self.process_command(command, args)
             return
 
-        op, *args = line.split()
-        logger.info("Op: %s, Args: %s", op, args)
+        op, *args = line.split(None, 1)
+        self.process_instruction(op, args[0] if args else "")
+
+    def process_instruction(self, op: str, args: str):
+        if trace.ENABLED:
+            trace.log(logger, "line", "Op: %s, Args: %s", op, args)
 
         encoder = Encoder(self.cursor, op)
-        self.instructions.append(encoder)
-        encoder.parse_args(args)
+        if profile.ENABLED:
+            start = time.perf_counter()
+            encoder.parse_operands(args)
+            profile.STATS.step("parse", start)
+        else:
+            encoder.parse_operands(args)
+        self.add_instruction(encoder)
 
+    def add_instruction(self, encoder: Encoder):
+        self.instructions.append(encoder)
         if encoder.label is None:
             # no labels
             encoder.encode()
             self.cursor += encoder.size
         else:
-            # label, reserve 4 bytes
-            self.cursor += 4
+            # label, start with the shortest encoding and grow it in fill_labels
+            encoder.reserved = 2
+            self.cursor += encoder.reserved
+
+    def layout(self):
+        """Assign addresses to all instructions and labels with the current sizes"""
+        self.cursor = 0
+        for instruction in self.instructions:
+            instruction.address = self.cursor
+            if isinstance(instruction, Padding):
+                instruction.size = 2 if self.cursor & 2 != 0 else 0
+            if instruction.label is None:
+                self.cursor += instruction.size
+            else:
+                self.cursor += instruction.reserved
+        for label, position in self.label_positions.items():
+            if position < len(self.instructions):
+                self.labels[label] = self.instructions[position].address
+            else:
+                self.labels[label] = self.cursor
 
     def fill_labels(self):
+        # Branch relaxation: every instruction with a label starts with 2 bytes,
+        # only those whose value doesn't fit are grown until nothing changes.
+        # Sizes never shrink, so this always reaches a fixed point.
+        changed = True
+        while changed:
+            self.layout()
+            changed = False
+            for instruction in self.instructions:
+                if instruction.label is None:
+                    continue
+                self.encode_label(instruction)
+                if instruction.size > instruction.reserved:
+                    instruction.reserved = instruction.size
+                    changed = True
+
         fillers = []
         for instruction in self.instructions:
-            if instruction.label is not None:
-                instruction.resolve_label(self.labels)
-                instruction.encode()
-                if instruction.size == 2:
-                    # pad with nop
-                    filler = Encoder(instruction.address + 2, "NOP")
-                    filler.encode()
-                    fillers.append(filler)
+            if instruction.label is not None and instruction.size < instruction.reserved:
+                # grown in an earlier iteration but fits now, pad with nop
+                filler = Encoder(instruction.address + 2, "NOP")
+                filler.encode()
+                fillers.append(filler)
+        # drop paddings not needed for alignment
+        self.instructions = [instruction for instruction in self.instructions if instruction.size != 0]
         self.instructions += fillers
         self.instructions.sort(key=lambda x: x.address)
 
+    def encode_label(self, instruction: Encoder):
+        instruction.resolve_label(self.labels)
+        instruction.encode()
+
     def create_encoded(self):
-        self.encoded = b""
+        # instructions are sorted by address, the last one ends the image
+        size = 0
+        if self.instructions:
+            size = self.instructions[-1].address + self.instructions[-1].size
+        buffer = bytearray(size)
         for instruction in self.instructions:
-            self.encoded += instruction.encoded.to_bytes(instruction.size, "little")
+            PACK_FORMATS[instruction.size].pack_into(buffer, instruction.address, instruction.encoded)
+        self.encoded = memoryview(buffer)
 
+    def write_encoded(self, file):
+        # write the buffer directly without creating a copy
+        file.write(self.encoded)
 
-    def assemble(self, assembly: str):
+    def reset(self):
         self.cursor = 0
         self.labels = {}
+        self.label_positions = {}
         self.instructions = []
+
+    def assemble(self, assembly: str):
+        self.reset()
+        start = time.perf_counter() if profile.ENABLED else 0
         for line in assembly.splitlines():
             self.process_line(line)
+        if profile.ENABLED:
+            start = profile.STATS.phase("lines", start)
         self.fill_labels()
+        if profile.ENABLED:
+            start = profile.STATS.phase("fill_labels", start)
         self.create_encoded()
+        if profile.ENABLED:
+            profile.STATS.phase("create_encoded", start)
 
     def print_instructions(self):
         for instruction in self.instructions:
             print(instruction)
+
+from .streaming import StreamingAssembler
+from .incremental import IncrementalAssembler
+from .objects import ObjectAssembler
@@ -123,7 +123,10 @@ class ImmediateEncoding:
     shift: int = 0
 
     def encode(self, arg: Argument, modifiers: list[str], *args):
-        value = arg.constant >> self.shift
+        return self.encode_value(arg.constant)
+
+    def encode_value(self, value: int):
+        value >>= self.shift
         ret = 0
         value_base = value & ((1<<self.size) - 1)
         ret |= value_base << self.base
@@ -185,13 +188,15 @@ class MemoryEncoding:
 
         ret |= self.base.encode(arg, modifiers, main_reg)
         if arg.offset.type == ArgumentType.Constant:
+            # arguments are shared, the scaled offset is kept local
             val = arg.offset.constant
             if arg.post_increment and (val == 1 or val == -1):
                 # adjust transfer size in case of short hand notation
                 val = (1 << transfer_size) * val
             val >>= transfer_size
-            arg.offset.constant = val
-        ret |= self.offset.encode(arg.offset, modifiers, main_reg)
+            ret |= self.offset.encode_value(val)
+        else:
+            ret |= self.offset.encode(arg.offset, modifiers, main_reg)
 
         if arg.post_increment:
             assert self.increment is not None
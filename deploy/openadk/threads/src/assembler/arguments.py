@@ -1,6 +1,9 @@
 import logging
 from enum import Enum, auto
-from .registers import Register, REGISTERS
+from functools import lru_cache
+from . import trace
+from .lexer import Token, TokenType, tokenize
+from .registers import Register
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +29,24 @@ class ExtractBits(Enum):
             case _:
                 assert False
 
+def imm_bucket(val: int) -> tuple[bool, int, int]:
+    """Classify an immediate by sign, significant bits and trailing zeros.
+
+    Range and alignment checks of ImmConstraint depend only on these
+    properties, so values in the same bucket match the same encodings.
+    """
+    negative = val < 0
+    bits = (~val if negative else val).bit_length()
+    zeros = (val & -val).bit_length() - 1 if val else 8
+    return negative, bits, min(zeros, 8)
+
 class Argument:
+    """Immutable operand, equal operands share one interned instance.
+
+    Encoding never modifies arguments, a resolved label is a new constant.
+    """
+    # one per operand of every line, slots keep large sources small
+    __slots__ = ("type", "register", "constant", "offset", "post_increment", "name", "extract_bits")
     type: ArgumentType
     register: Register
     constant: int
@@ -34,90 +54,71 @@ class Argument:
     #pre_increment: bool
     post_increment: bool
     name: str
-    extract_bits: ExtractBits = ExtractBits.All
+    extract_bits: ExtractBits
+
+    def __init__(self, type: ArgumentType, register: Register = None, constant: int = None, offset: "Argument" = None,
+            post_increment: bool = False, name: str = None, extract_bits: ExtractBits = ExtractBits.All):
+        init = object.__setattr__
+        init(self, "type", type)
+        init(self, "register", register)
+        init(self, "constant", constant)
+        init(self, "offset", offset)
+        init(self, "post_increment", post_increment)
+        init(self, "name", name)
+        init(self, "extract_bits", extract_bits)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Argument is immutable, can't set {name}")
 
-    def as_register(self, register: Register):
-        self.type = ArgumentType.Register
-        self.register = register
+    @classmethod
+    @lru_cache(maxsize=None)
+    def from_register(cls, register: Register):
+        return cls(ArgumentType.Register, register=register)
 
-    def as_constant(self, constant: int):
-        self.type = ArgumentType.Constant
-        self.constant = constant
+    @classmethod
+    @lru_cache(maxsize=65536)
+    def from_constant(cls, constant: int):
+        return cls(ArgumentType.Constant, constant=constant)
 
-    def as_memory(self, base: Register, offset: "Argument"):
-        self.type = ArgumentType.Memory
-        self.register = base
-        self.offset = offset
+    @classmethod
+    def from_memory(cls, base: Register, offset: "Argument", post_increment: bool = False):
+        return cls(ArgumentType.Memory, register=base, offset=offset, post_increment=post_increment)
 
-    def as_label(self, name: str):
-        self.type = ArgumentType.Label
-        self.name = name
+    @classmethod
+    def from_label(cls, name: str, extract_bits: ExtractBits = ExtractBits.All):
+        return cls(ArgumentType.Label, name=name, extract_bits=extract_bits)
 
-    def resolve_label(self, labels: dict[str, int], address: int):
+    def resolve_label(self, labels: dict[str, int], address: int) -> "Argument":
         val = labels.get(self.name)
         if val is None:
             logger.critical("Label %s is not defined", self.name)
             exit()
         val -= address # take values pc relative
-        self.as_constant(self.extract_bits.extract(val))
+        return Argument.from_constant(self.extract_bits.extract(val))
+
+    def shape(self) -> tuple:
+        """Abstract signature of the argument used to cache encoding selection"""
+        match self.type:
+            case ArgumentType.Register:
+                return (self.type, self.register.unit, self.register.number)
+            case ArgumentType.Constant:
+                return (self.type, imm_bucket(self.constant))
+            case ArgumentType.Memory:
+                return (self.type, self.register.unit, self.register.number, self.offset.shape(), self.post_increment)
+            case _:
+                return (self.type,)
 
     @classmethod
     def from_str(cls, arg: str):
-        self = cls()
-
-        match arg[0]:
-            case "#":
-                match arg[1:3]:
-                    case "HI":
-                        self.extract_bits = ExtractBits.Top
-                        val = arg[4:-1]
-                    case "LO":
-                        self.extract_bits = ExtractBits.Bottom
-                        val = arg[4:-1]
-                    case _:
-                        val = arg[1:]
-                base = 10
-                if val.startswith("0x"):
-                    base = 16
-                try:
-                    # try decode immediate value
-                    const = int(val, base)
-                    const = self.extract_bits.extract(const)
-                    self.as_constant(const)
-                except ValueError:
-                    # must be a lable
-                    logger.debug("Can't decode %s as int, must be label", val)
-                    self.as_label(val)
-            case "[": # ]
-                # memory reference
-                arg = arg.strip("[]")
-                fallback_offset = 0
-                if arg.endswith("++"):
-                    self.post_increment = True
-                    fallback_offset = 1
-                elif arg.endswith("--"):
-                    self.post_increment = True
-                    fallback_offset = -1
-                else:
-                    self.post_increment = False
-                arg = arg.strip("+-")
-                str_base, *str_offset = arg.split("+")
-                assert len(str_offset) <= 1
-                base = REGISTERS[str_base]
-                if not str_offset:
-                    str_offset = "#" + str(fallback_offset)
-                else:
-                    str_offset = str_offset[0]
-                offset = cls.from_str(str_offset)
-                self.as_memory(base, offset)
-            case _ if arg in REGISTERS:
-                # register
-                self.as_register(REGISTERS[arg])
-            case _:
-                # must be a label
-                self.as_label(arg)
+        args = parse_operands(arg)
+        if len(args) != 1:
+            logger.critical("Expected one operand in %s", arg)
+            exit()
+        return args[0]
 
-        return self
+    @classmethod
+    def from_tokens(cls, tokens: tuple[Token, ...]) -> tuple["Argument", ...]:
+        return tuple(map(intern, tokens))
 
     def __repr__(self):
         match self.type:
@@ -131,3 +132,26 @@ class Argument:
                 return f"Argument(type=Label, name={self.name})"
             case _:
                 return "Unknown argument type"
+
+@lru_cache(maxsize=65536)
+def intern(token: Token) -> Argument:
+    """The shared argument of a token"""
+    kind = token[0]
+    if kind is TokenType.Register:
+        return Argument.from_register(token[1])
+    if kind is TokenType.Immediate:
+        return Argument.from_constant(token[1])
+    if kind is TokenType.Memory:
+        _, base, offset, post_increment = token
+        return Argument.from_memory(base, intern(offset), post_increment)
+    _, name, part = token
+    if trace.ENABLED:
+        trace.log(logger, "label", "%s is a label", name)
+    if part is None:
+        return Argument.from_label(name)
+    return Argument.from_label(name, ExtractBits.Top if part == "HI" else ExtractBits.Bottom)
+
+@lru_cache(maxsize=4096)
+def parse_operands(text: str) -> tuple[Argument, ...]:
+    """Arguments of the operand text of a line, repeated lines are only scanned once"""
+    return Argument.from_tokens(tokenize(text))
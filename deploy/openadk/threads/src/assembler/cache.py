@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Content addressed cache of assembled images.
+#
+# The key covers the source text, the assembler itself and the options that
+# change the output. The instruction tables and encoding classes are plain
+# python modules, so hashing the package sources catches every change to them.
+# Each entry is stored as <key>.bin (the image) and <key>.sym (the labels as
+# JSON). The modification time is the last use, the oldest entries are evicted
+# when the directory grows beyond max_size bytes.
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+@lru_cache(maxsize=1)
+def table_fingerprint() -> str:
+    """Hash of all assembler sources, changes whenever the tables change"""
+    digest = hashlib.sha256()
+    package = Path(__file__).parent
+    for path in sorted(package.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+def cache_key(source: str, options: dict) -> str:
+    digest = hashlib.sha256()
+    digest.update(table_fingerprint().encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    digest.update(source.encode())
+    return digest.hexdigest()
+
+class AssemblyCache:
+    directory: Path
+    max_size: int
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def paths(self, key: str) -> tuple[Path, Path]:
+        return self.directory / f"{key}.bin", self.directory / f"{key}.sym"
+
+    def get(self, key: str) -> tuple[bytes, dict[str, int]] | None:
+        bin_path, sym_path = self.paths(key)
+        try:
+            encoded = bin_path.read_bytes()
+            labels = json.loads(sym_path.read_text())
+        except (OSError, ValueError):
+            logger.debug("Cache miss %s", key)
+            return None
+        # mark as recently used
+        os.utime(bin_path)
+        os.utime(sym_path)
+        logger.debug("Cache hit %s", key)
+        return encoded, labels
+
+    def put(self, key: str, encoded: bytes, labels: dict[str, int]):
+        bin_path, sym_path = self.paths(key)
+        # write the symbols last, a complete .sym marks a complete entry
+        self.write(bin_path, bytes(encoded))
+        self.write(sym_path, json.dumps(labels).encode())
+        self.evict()
+
+    def write(self, path: Path, data: bytes):
+        # atomic replace so concurrent builds never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def evict(self):
+        entries = {}
+        for path in self.directory.iterdir():
+            if path.suffix not in (".bin", ".sym"):
+                continue
+            stat = path.stat()
+            size, mtime = entries.get(path.stem, (0, 0))
+            entries[path.stem] = (size + stat.st_size, max(mtime, stat.st_mtime))
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda entry: entry[1][1]):
+            if total <= self.max_size:
+                break
+            logger.debug("Evicting %s", key)
+            for path in self.paths(key):
+                path.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,253 @@
+import logging
+from .argument_encodings import RegisterEncoding, ImmediateEncoding, MemoryEncoding, PieceImmediateEncoding, BU_encoding, O2R_encoding
+from .arguments import ArgumentType
+from .constraints import RegConstraint, ImmConstraint, PieceImmConstraint, MemoryConstraint, UnitConstraint
+from .modifiers import gen_transfer_size
+from .registers import RegUnits, ADDRESS_UNITS, DATA_UNITS
+
+logger = logging.getLogger(__name__)
+
+# Generates straight line python functions for matching and encoding the
+# arguments of an encoding class. All field positions and masks are known when
+# the class is defined, so they are inlined as constants. The generic
+# constraint and argument encoding classes remain the reference implementation.
+
+def offset_error(val: int, transfer_size: int):
+    logger.critical("Offset (%d) must be multiple of transfer size %d", val, 1 << transfer_size)
+    exit()
+
+class FunctionBuilder:
+    lines: list[str]
+    namespace: dict
+
+    def __init__(self, header: str):
+        self.lines = [header]
+        self.namespace = {
+            "REGISTER": ArgumentType.Register,
+            "CONSTANT": ArgumentType.Constant,
+            "MEMORY": ArgumentType.Memory,
+            "ADDRESS_UNITS": frozenset(ADDRESS_UNITS),
+            "DATA_UNITS": frozenset(DATA_UNITS),
+            "gen_transfer_size": gen_transfer_size,
+            "offset_error": offset_error,
+            }
+        for unit in RegUnits:
+            self.namespace[f"U_{unit.name}"] = unit
+
+    def emit(self, indent: int, line: str):
+        self.lines.append("    " * indent + line)
+
+    def constant(self, value) -> str:
+        # make a non literal value available to the generated code
+        name = f"K{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def build(self, name: str):
+        source = "\n".join(self.lines)
+        exec(compile(source, f"<{name}>", "exec"), self.namespace)
+        function = self.namespace[name]
+        function.source = source
+        return function
+
+
+def gen_unit_check(fb: FunctionBuilder, indent: int, unit: str, constraint: UnitConstraint, main: str | None):
+    main_unit = f"{main}.unit" if main else "None"
+    match constraint:
+        case UnitConstraint.Any:
+            return
+        case UnitConstraint.Same:
+            check = f"{unit} is {main_unit}"
+        case UnitConstraint.Other:
+            check = f"({unit} in ADDRESS_UNITS and {main_unit} in ADDRESS_UNITS or {unit} in DATA_UNITS and {main_unit} in DATA_UNITS) and {unit} is not {main_unit}"
+        case UnitConstraint.Control:
+            check = f"{unit} is U_Control"
+        case UnitConstraint.O2R:
+            check = f"{unit} is not {main_unit}"
+        case UnitConstraint.Address:
+            check = f"{unit} in ADDRESS_UNITS"
+        case UnitConstraint.Data:
+            check = f"{unit} in DATA_UNITS"
+        case UnitConstraint.Address0:
+            check = f"{unit} is U_Address0"
+    if main is None and constraint in (UnitConstraint.Same, UnitConstraint.O2R):
+        fb.emit(indent, "raise AssertionError")
+        return
+    fb.emit(indent, f"if not ({check}): return False")
+
+def gen_match_reg(fb: FunctionBuilder, indent: int, constraint: RegConstraint, reg: str, main: str | None):
+    if type(constraint.unit) == RegUnits:
+        fb.emit(indent, f"if {reg}.unit is not U_{constraint.unit.name}: return False")
+    else:
+        if constraint.pc:
+            # PC matches without further checks
+            fb.emit(indent, f"if {reg}.unit is not U_PC:")
+            indent += 1
+        gen_unit_check(fb, indent, f"{reg}.unit", constraint.unit, main)
+    if constraint.same_num:
+        if main is None:
+            fb.emit(indent, "return False")
+        else:
+            fb.emit(indent, f"if {reg}.number != {main}.number: return False")
+    else:
+        fb.emit(indent, f"if not ({constraint.num.start} <= {reg}.number < {constraint.num.stop}): return False")
+
+def gen_match_val(fb: FunctionBuilder, indent: int, constraint: ImmConstraint, val: str):
+    if constraint.shift:
+        fb.emit(indent, f"if {val} & {(1 << constraint.shift) - 1}: return False")
+        fb.emit(indent, f"{val} >>= {constraint.shift}")
+    fb.emit(indent, f"if not ({constraint.min} <= {val} < {constraint.max}): return False")
+
+def gen_match(fb: FunctionBuilder, indent: int, constraint, arg: str, main: str | None, n: int):
+    match constraint:
+        case RegConstraint():
+            fb.emit(indent, f"if {arg}.type is not REGISTER: return False")
+            gen_match_reg(fb, indent, constraint, f"{arg}.register", main)
+        case ImmConstraint():
+            fb.emit(indent, f"if {arg}.type is not CONSTANT: return False")
+            fb.emit(indent, f"v{n} = {arg}.constant")
+            gen_match_val(fb, indent, constraint, f"v{n}")
+        case PieceImmConstraint():
+            fb.emit(indent, f"if {arg}.type is not CONSTANT: return False")
+            fb.emit(indent, f"v{n} = {arg}.constant")
+            if constraint.extra_map is not None:
+                fb.emit(indent, f"if v{n} != {constraint.extra_map[0]}:")
+                indent += 1
+            fb.emit(indent, f"if v{n} & ({~constraint.mask}): return False")
+            if constraint.extra_map is not None:
+                fb.emit(indent, f"if v{n} == {constraint.extra_map[1]}: return False")
+        case MemoryConstraint():
+            fb.emit(indent, f"if {arg}.type is not MEMORY: return False")
+            fb.emit(indent, f"b{n} = {arg}.register")
+            gen_match_reg(fb, indent, constraint.base, f"b{n}", None)
+            fb.emit(indent, f"ts{n} = gen_transfer_size({constraint.transfer_size}, modifiers)")
+            fb.emit(indent, f"o{n} = {arg}.offset")
+            fb.emit(indent, f"if o{n}.type is CONSTANT:")
+            if isinstance(constraint.offset, ImmConstraint):
+                fb.emit(indent + 1, f"v{n} = o{n}.constant")
+                fb.emit(indent + 1, f"if {arg}.post_increment and (v{n} == 1 or v{n} == -1):")
+                fb.emit(indent + 2, f"v{n} = (1 << ts{n}) * v{n}")
+                fb.emit(indent + 1, f"if v{n} % (1 << ts{n}) != 0:")
+                fb.emit(indent + 2, f"offset_error(v{n}, ts{n})")
+                fb.emit(indent + 1, f"v{n} >>= ts{n}")
+                gen_match_val(fb, indent + 1, constraint.offset, f"v{n}")
+            else:
+                fb.emit(indent + 1, "return False")
+            fb.emit(indent, "else:")
+            gen_match(fb, indent + 1, constraint.offset, f"o{n}", f"b{n}", n + 1)
+            if not constraint.post_increment:
+                fb.emit(indent, f"if {arg}.post_increment: return False")
+        case _:
+            raise TypeError(f"Can't compile constraint {constraint}")
+
+def compile_match(cls):
+    fb = FunctionBuilder("def match(args, modifiers):")
+    fb.emit(1, f"if len(args) != {len(cls.constraints)}: return False")
+    main = None
+    if cls.main_reg is not None:
+        # check main reg first
+        fb.emit(1, f"a{cls.main_reg} = args[{cls.main_reg}]")
+        gen_match(fb, 1, cls.constraints[cls.main_reg], f"a{cls.main_reg}", None, cls.main_reg * 10)
+        fb.emit(1, f"main = a{cls.main_reg}.register")
+        main = "main"
+    for i, constraint in enumerate(cls.constraints):
+        if i == cls.main_reg:
+            continue
+        fb.emit(1, f"a{i} = args[{i}]")
+        gen_match(fb, 1, constraint, f"a{i}", main, i * 10)
+    fb.emit(1, "return True")
+    return fb.build("match")
+
+
+def gen_encode_reg(fb: FunctionBuilder, indent: int, encoding: RegisterEncoding, reg: str, main: str | None):
+    if encoding.base is None:
+        # already given by other argument
+        return
+    if encoding.pc_bit is not None:
+        fb.emit(indent, f"if {reg}.unit is U_PC:")
+        fb.emit(indent + 1, f"ret |= {1 << encoding.pc_bit}")
+        fb.emit(indent, "else:")
+        indent += 1
+    unit = f"{reg}.unit"
+    num = f"{reg}.number"
+    if encoding.unit_base is not None:
+        if encoding.split_unit_base is not None:
+            fb.emit(indent, f"ret |= ({unit}.value & {(1 << encoding.unit_size) - 1}) << {encoding.unit_base}")
+            fb.emit(indent, f"ret |= (({unit}.value >> {encoding.unit_size}) & {(1 << encoding.split_unit_size) - 1}) << {encoding.split_unit_base}")
+        elif encoding.unit_size == 1:
+            fb.emit(indent, f"if {unit} is U_Data1 or {unit} is U_Address1: ret |= {1 << encoding.unit_base}")
+        elif encoding.unit_size == 2:
+            table = fb.constant({u: v << encoding.unit_base for u, v in BU_encoding.items()})
+            fb.emit(indent, f"ret |= {table}[{unit}]")
+        else:
+            fb.emit(indent, f"ret |= {unit}.value << {encoding.unit_base}")
+    if encoding.unit_constraint == UnitConstraint.O2R:
+        assert encoding.size == 5
+        size = 3
+        table = fb.constant({
+            main_unit: {u: v << (encoding.base + 3) for u, v in replacement.items()}
+            for main_unit, replacement in O2R_encoding.items()
+            })
+        fb.emit(indent, f"ret |= {table}[{main}.unit][{unit}]")
+    else:
+        size = encoding.size
+    fb.emit(indent, f"ret |= ({num} & {(1 << size) - 1}) << {encoding.base}")
+    if encoding.split_base is not None:
+        fb.emit(indent, f"ret |= (({num} >> {size}) & {(1 << encoding.split_size) - 1}) << {encoding.split_base}")
+
+def gen_encode_imm(fb: FunctionBuilder, indent: int, encoding: ImmediateEncoding, val: str):
+    if encoding.shift:
+        fb.emit(indent, f"{val} >>= {encoding.shift}")
+    fb.emit(indent, f"ret |= ({val} & {(1 << encoding.size) - 1}) << {encoding.base}")
+    if encoding.split_base is not None:
+        fb.emit(indent, f"ret |= (({val} >> {encoding.size}) & {(1 << encoding.split_size) - 1}) << {encoding.split_base}")
+    if encoding.sign_extend is not None and not encoding.force_signed:
+        fb.emit(indent, f"if {val} < 0: ret |= {1 << encoding.sign_extend}")
+
+def gen_encode(fb: FunctionBuilder, indent: int, encoding, arg: str, main: str | None, n: int):
+    match encoding:
+        case RegisterEncoding():
+            gen_encode_reg(fb, indent, encoding, f"{arg}.register", main)
+        case ImmediateEncoding():
+            fb.emit(indent, f"v{n} = {arg}.constant")
+            gen_encode_imm(fb, indent, encoding, f"v{n}")
+        case PieceImmediateEncoding():
+            for src, dst, size in encoding.mapping:
+                fb.emit(indent, f"ret |= (({arg}.constant >> {src}) & {(1 << size) - 1}) << {dst}")
+        case MemoryEncoding():
+            fb.emit(indent, f"ts{n} = gen_transfer_size({encoding.transfer_size}, modifiers)")
+            if encoding.transfer_bits is not None:
+                fb.emit(indent, f"ret |= (ts{n} & 1) << {encoding.transfer_bits[0]}")
+                fb.emit(indent, f"ret |= (ts{n} >> 1) << {encoding.transfer_bits[1]}")
+            gen_encode_reg(fb, indent, encoding.base, f"{arg}.register", main)
+            fb.emit(indent, f"o{n} = {arg}.offset")
+            if isinstance(encoding.offset, ImmediateEncoding):
+                # the scaled offset is kept local, the argument is not modified
+                fb.emit(indent, f"v{n} = o{n}.constant")
+                fb.emit(indent, f"if {arg}.post_increment and (v{n} == 1 or v{n} == -1):")
+                fb.emit(indent + 1, f"v{n} = (1 << ts{n}) * v{n}")
+                fb.emit(indent, f"v{n} >>= ts{n}")
+                gen_encode_imm(fb, indent, encoding.offset, f"v{n}")
+            else:
+                gen_encode(fb, indent, encoding.offset, f"o{n}", main, n + 1)
+            if encoding.increment is not None:
+                fb.emit(indent, f"if {arg}.post_increment:")
+                fb.emit(indent + 1, f"ret |= {(1 << encoding.increment[0]) | (1 << encoding.increment[1])}")
+            else:
+                fb.emit(indent, f"assert not {arg}.post_increment")
+        case _:
+            raise TypeError(f"Can't compile argument encoding {encoding}")
+
+def compile_encode(cls):
+    fb = FunctionBuilder("def encode(args, modifiers):")
+    fb.emit(1, f"assert len(args) == {len(cls.args_encoding)}")
+    fb.emit(1, "ret = 0")
+    main = None
+    if cls.main_reg is not None:
+        fb.emit(1, f"main = args[{cls.main_reg}].register")
+        main = "main"
+    for i, encoding in enumerate(cls.args_encoding):
+        fb.emit(1, f"a{i} = args[{i}]")
+        gen_encode(fb, 1, encoding, f"a{i}", main, i * 10)
+    fb.emit(1, "return ret")
+    return fb.build("encode")
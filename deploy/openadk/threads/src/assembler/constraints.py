@@ -1,6 +1,7 @@
 import logging
 from enum import Enum, auto
 from dataclasses import dataclass
+from . import trace
 from .arguments import Argument, ArgumentType
 from .modifiers import gen_transfer_size
 from .registers import RegUnits, Register, CONTROL_REGS, ADDRESS_UNITS, DATA_UNITS
@@ -47,7 +48,8 @@ class UnitConstraint(Enum):
                 if unit == RegUnits.Address0:
                     return True
 
-        logger.debug("Match unit failed, arg unit: %s, main unit: %s, constraint: %s", unit, main_unit, self)
+        if trace.ENABLED:
+            trace.log(logger, "reject", "Match unit failed, arg unit: %s, main unit: %s, constraint: %s", unit, main_unit, self)
         return False
 
 @dataclass
@@ -59,7 +61,8 @@ class RegConstraint:
 
     def match(self, arg: Argument, modifiers: list[str], main_reg: Register = None):
         if arg.type != ArgumentType.Register:
-            logger.debug("Match register failed, wrong argument type: %s", arg.type)
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match register failed, wrong argument type: %s", arg.type)
             return False
         return self.match_reg(arg.register, main_reg)
 
@@ -67,7 +70,8 @@ class RegConstraint:
         if type(self.unit) == RegUnits:
             # Concrete unit
             if self.unit != register.unit:
-                logger.debug("Match register failed, given unit %s doesn't match required %s", register.unit, self.unit)
+                if trace.ENABLED:
+                    trace.log(logger, "reject", "Match register failed, given unit %s doesn't match required %s", register.unit, self.unit)
                 return False
         else:
             if self.pc and register.unit == RegUnits.PC:
@@ -78,11 +82,13 @@ class RegConstraint:
             if main_reg and register.number == main_reg.number:
                 return True
             else:
-                logger.debug("Match register failed, must be same numb but arg num %d != main_reg num %d", register.number, main_reg.number)
+                if trace.ENABLED:
+                    trace.log(logger, "reject", "Match register failed, must be same numb but arg num %d != main_reg num %d", register.number, main_reg.number)
                 return False
         if register.number in self.num:
             return True
-        logger.debug("Match register failed, arg num %d not in range %s", register.number, self.num)
+        if trace.ENABLED:
+            trace.log(logger, "reject", "Match register failed, arg num %d not in range %s", register.number, self.num)
         return False
 
 
@@ -94,17 +100,20 @@ class ImmConstraint:
 
     def match(self, arg: Argument, modifiers: list[str], *args):
         if arg.type != ArgumentType.Constant:
-            logger.debug("Match constant failed, wrong argument type: %s", arg.type)
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match constant failed, wrong argument type: %s", arg.type)
             return False
         return self.match_val(arg.constant)
 
     def match_val(self, val: int):
         if val & ((1 << self.shift) - 1) != 0:
-            logger.debug("Match constant failed, value %d is shifted by %d but has lower bits set", val, self.shift)
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match constant failed, value %d is shifted by %d but has lower bits set", val, self.shift)
             return False
         val >>= self.shift
         if val not in range(self.min, self.max):
-            logger.debug("Match constant failed, argument: %d not in range %d %d", val, self.min, self.max)
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match constant failed, argument: %d not in range %d %d", val, self.min, self.max)
             return False
         return True
 
@@ -115,15 +124,18 @@ class PieceImmConstraint:
 
     def match(self, arg: Argument, modifiers: list[str], *args):
         if arg.type != ArgumentType.Constant:
-            logger.debug("Match piece constant failed, wrong argument type: %s", arg.type)
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match piece constant failed, wrong argument type: %s", arg.type)
             return False
         if self.extra_map is not None and arg.constant == self.extra_map[0]:
             return True
         if arg.constant & (~self.mask) != 0:
-            logger.debug("Match piece constant failed, val 0x%x has bits ouf of mask 0x%x", arg.constant, self.mask)
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match piece constant failed, val 0x%x has bits ouf of mask 0x%x", arg.constant, self.mask)
             return False
         if self.extra_map is not None and arg.constant == self.extra_map[1]:
-            logger.debug("Match piece constatn failed, val 0x%x is in extra map", arg.constant)
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match piece constatn failed, val 0x%x is in extra map", arg.constant)
             return False
         return True
 
@@ -138,14 +150,20 @@ class MemoryConstraint:
 
     def match(self, arg: Argument, modifiers: list[str], *args):
         if arg.type != ArgumentType.Memory:
-            logger.debug("Match memory failed, wrong argument type: %s", arg.type)
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match memory failed, wrong argument type: %s", arg.type)
             return False
         if not self.base.match_reg(arg.register):
-            logger.debug("Match memory failed, base reg doesn't match")
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match memory failed, base reg doesn't match")
             return False
 
         transfer_size = gen_transfer_size(self.transfer_size, modifiers)
         if arg.offset.type == ArgumentType.Constant:
+            if not isinstance(self.offset, ImmConstraint):
+                if trace.ENABLED:
+                    trace.log(logger, "reject", "Match memory failed, offset must be a register")
+                return False
             val = arg.offset.constant
             if arg.post_increment and (val == 1 or val == -1):
                 # adjust transfer size in case of short hand notation
@@ -155,14 +173,17 @@ class MemoryConstraint:
                 exit()
             val >>= transfer_size
             if not self.offset.match_val(val):
-                logger.debug("Match memory failed, offset doesn't match")
+                if trace.ENABLED:
+                    trace.log(logger, "reject", "Match memory failed, offset doesn't match")
                 return False
         elif not self.offset.match(arg.offset, modifiers, arg.register):
-            logger.debug("Match memory failed, offset doesn't match")
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match memory failed, offset doesn't match")
             return False
 
         if arg.post_increment and not self.post_increment:
-            logger.debug("Match memory failed, post increment not supported")
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match memory failed, post increment not supported")
             return False
 
         return True
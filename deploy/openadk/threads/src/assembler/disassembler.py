@@ -0,0 +1,413 @@
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterator
+from .argument_encodings import RegisterEncoding, ImmediateEncoding, MemoryEncoding, PieceImmediateEncoding, BU_encoding, O2R_encoding
+from .arguments import Argument
+from .constraints import UnitConstraint
+from .instruction_encodings import Encoding, EncodingType
+from .instructions import INSTRUCTIONS, BRANCH_RELATIVE_INSTRUCTIONS, Instruction, lookup_instruction
+from .modifiers import MODIFIERS, CONDITION_MAP, TRANSFER_MAP
+from .registers import REGISTERS, RegUnits, Register
+
+logger = logging.getLogger(__name__)
+
+# Table driven disassembler.
+#
+# Every encoding has fixed bits (const_bits and the type prefix) and variable
+# bits (argument fields, modifiers, conditions). The decode index maps the
+# word masked with a few frequently fixed bits to the encodings agreeing with
+# them, so a word is decoded by one lookup and a mask compare of the few
+# candidates. The argument fields are then read back with the layouts of the
+# argument encodings and the result is verified by encoding the text again.
+
+TYPE_BITS = {
+    EncodingType.Core: 0,
+    EncodingType.Extended: 0xc000,
+    EncodingType.Long: 0xb000,
+    }
+
+# number of bits in the key of the decode index
+KEY_BITS = 12
+
+BU_units = {value: unit for unit, value in BU_encoding.items()}
+O2R_units = {main: {value: unit for unit, value in units.items()} for main, units in O2R_encoding.items()}
+OTHER_UNIT = {
+    RegUnits.Data0: RegUnits.Data1,
+    RegUnits.Data1: RegUnits.Data0,
+    RegUnits.Address0: RegUnits.Address1,
+    RegUnits.Address1: RegUnits.Address0,
+    }
+TRANSFER_NAMES = {size: name for name, size in TRANSFER_MAP.items()}
+# first name of every condition, A (always) is the default and not written
+CONDITION_NAMES = {}
+for name, value in CONDITION_MAP.items():
+    if value and name in MODIFIERS:
+        CONDITION_NAMES.setdefault(value, name)
+
+# prefer the numbered register names over the ABI aliases
+REGISTER_NAMES = {}
+for name, register in REGISTERS.items():
+    key = (register.unit, register.number)
+    if key not in REGISTER_NAMES or "." in name:
+        REGISTER_NAMES[key] = name
+
+def field(word: int, base: int, size: int) -> int:
+    return (word >> base) & ((1 << size) - 1)
+
+def field_mask(base: int, size: int) -> int:
+    if base is None or size is None:
+        return 0
+    return ((1 << size) - 1) << base
+
+def instruction_size(halfword: int) -> int:
+    """Size of the instruction starting with the given 16 bit word"""
+    if halfword & 0xc000 == 0xc000 or halfword & 0xf000 == 0xb000:
+        return 4
+    return 2
+
+def variable_mask(encoding) -> int:
+    """Bits of an argument encoding depending on the argument value"""
+    match encoding:
+        case RegisterEncoding():
+            if encoding.reg is not None or encoding.base is None:
+                return 0
+            mask = field_mask(encoding.base, encoding.size)
+            mask |= field_mask(encoding.split_base, encoding.split_size)
+            mask |= field_mask(encoding.unit_base, encoding.unit_size)
+            mask |= field_mask(encoding.split_unit_base, encoding.split_unit_size)
+            if encoding.pc_bit is not None:
+                mask |= 1 << encoding.pc_bit
+            return mask
+        case ImmediateEncoding():
+            mask = field_mask(encoding.base, encoding.size) | field_mask(encoding.split_base, encoding.split_size)
+            if encoding.sign_extend is not None and not encoding.force_signed:
+                mask |= 1 << encoding.sign_extend
+            return mask
+        case PieceImmediateEncoding():
+            mask = 0
+            for src, dst, size in encoding.mapping:
+                mask |= field_mask(dst, size)
+            return mask
+        case MemoryEncoding():
+            mask = variable_mask(encoding.base) | variable_mask(encoding.offset)
+            for bit in (encoding.transfer_bits or ()):
+                mask |= 1 << bit
+            for bit in (encoding.increment or ()):
+                mask |= 1 << bit
+            return mask
+    assert False
+
+@dataclass
+class DecodeEntry:
+    instruction: Instruction
+    encoding: Encoding
+    size: int
+    mask: int # fixed bits
+    value: int # value of the fixed bits
+
+    @classmethod
+    def from_encoding(cls, instruction: Instruction, encoding: Encoding):
+        size = 2 if encoding.type == EncodingType.Core else 4
+        fixed_bits = encoding.const_bits | TYPE_BITS[encoding.type]
+        variable = 0
+        for arg_encoding in encoding.args_encoding:
+            variable |= variable_mask(arg_encoding)
+        for bit in encoding.modifiers.values():
+            variable |= 1 << bit
+        if encoding.L2 is not None:
+            variable |= 1 << encoding.L2
+        if encoding.conditional:
+            variable |= 0xf << encoding.condition_base
+        # bits set by const_bits are always set, whatever else uses them
+        variable &= ~fixed_bits
+        mask = ((1 << size * 8) - 1) & ~variable
+        return cls(instruction, encoding, size, mask, fixed_bits & mask)
+
+@dataclass
+class DecodeIndex:
+    key_mask: int
+    table: dict[int, list[DecodeEntry]]
+
+    @classmethod
+    def build(cls, entries: list[DecodeEntry]):
+        # key on the bits fixed by most encodings, entries not fixing some of
+        # them are added under every value of these bits
+        width = entries[0].size * 8
+        counts = [sum(entry.mask >> bit & 1 for entry in entries) for bit in range(width)]
+        key_bits = sorted(range(width), key=lambda bit: -counts[bit])[:KEY_BITS]
+        key_mask = sum(1 << bit for bit in key_bits)
+        table = {}
+        for entry in entries:
+            free = [bit for bit in key_bits if not entry.mask >> bit & 1]
+            for combination in range(1 << len(free)):
+                key = entry.value & key_mask
+                for i, bit in enumerate(free):
+                    if combination >> i & 1:
+                        key |= 1 << bit
+                table.setdefault(key, []).append(entry)
+        # most specific encodings first, aliases keep the instruction order
+        for candidates in table.values():
+            candidates.sort(key=lambda entry: -entry.mask.bit_count())
+        return cls(key_mask, table)
+
+    def candidates(self, word: int) -> Iterator[DecodeEntry]:
+        for entry in self.table.get(word & self.key_mask, ()):
+            if word & entry.mask == entry.value:
+                yield entry
+
+def build_decode_index(instructions: list[Instruction]) -> dict[int, DecodeIndex]:
+    entries = {2: [], 4: []}
+    for instruction in instructions:
+        for encoding in instruction.encodings:
+            entry = DecodeEntry.from_encoding(instruction, encoding)
+            entries[entry.size].append(entry)
+    return {size: DecodeIndex.build(size_entries) for size, size_entries in entries.items()}
+
+DECODE_INDEX = build_decode_index(INSTRUCTIONS)
+
+def decode_register(encoding: RegisterEncoding, word: int, main_reg: Register = None) -> Register:
+    if encoding.reg is not None:
+        return encoding.reg
+    constraint = encoding.unit_constraint
+    if encoding.base is None:
+        # same number as the main register
+        if constraint == UnitConstraint.Other:
+            return Register(OTHER_UNIT[main_reg.unit], main_reg.number)
+        return Register(main_reg.unit, main_reg.number)
+    if encoding.pc_bit is not None and word >> encoding.pc_bit & 1:
+        return REGISTERS["PC"]
+
+    size = encoding.size
+    if constraint == UnitConstraint.O2R:
+        size = 3
+        unit = O2R_units[main_reg.unit][field(word, encoding.base + 3, 2)]
+    elif encoding.unit_base is None:
+        match constraint:
+            case UnitConstraint.Same:
+                unit = main_reg.unit
+            case UnitConstraint.Control:
+                unit = RegUnits.Control
+            case UnitConstraint.Address0:
+                unit = RegUnits.Address0
+            case _:
+                return None
+    else:
+        unit_num = field(word, encoding.unit_base, encoding.unit_size)
+        if encoding.split_unit_base is not None:
+            unit_num |= field(word, encoding.split_unit_base, encoding.split_unit_size) << encoding.unit_size
+            unit = RegUnits(unit_num)
+        elif encoding.unit_size == 1:
+            if constraint == UnitConstraint.Address:
+                unit = RegUnits.Address1 if unit_num else RegUnits.Address0
+            else:
+                unit = RegUnits.Data1 if unit_num else RegUnits.Data0
+        elif encoding.unit_size == 2:
+            unit = BU_units[unit_num]
+        else:
+            unit = RegUnits(unit_num)
+
+    num = field(word, encoding.base, size)
+    if encoding.split_base is not None:
+        num |= field(word, encoding.split_base, encoding.split_size) << size
+    return Register(unit, num)
+
+def decode_immediate(encoding: ImmediateEncoding, word: int) -> int:
+    size = encoding.size + (encoding.split_size or 0)
+    value = field(word, encoding.base, encoding.size)
+    if encoding.split_base is not None:
+        value |= field(word, encoding.split_base, encoding.split_size) << encoding.size
+    if encoding.force_signed:
+        if value >> (size - 1):
+            value -= 1 << size
+    elif encoding.sign_extend is not None and word >> encoding.sign_extend & 1:
+        value -= 1 << size
+    return value << encoding.shift
+
+def decode_piece_immediate(encoding: PieceImmediateEncoding, word: int) -> int:
+    value = 0
+    for src, dst, size in encoding.mapping:
+        value |= field(word, dst, size) << src
+    return value
+
+def format_register(register: Register) -> str:
+    return REGISTER_NAMES[(register.unit, register.number)]
+
+def format_constant(value: int) -> str:
+    # negative values must be decimal, the parser doesn't take -0x
+    if value < 0:
+        return f"#{value}"
+    return f"#0x{value:x}"
+
+def decode_memory(encoding: MemoryEncoding, word: int, transfer_size: int) -> str:
+    base = decode_register(encoding.base, word)
+    post_increment = False
+    if encoding.increment is not None:
+        update, post = encoding.increment
+        if word >> update & 1 != word >> post & 1:
+            # pre increment is not supported by the assembler
+            return None
+        post_increment = bool(word >> post & 1)
+
+    if isinstance(encoding.offset, RegisterEncoding):
+        offset = format_register(decode_register(encoding.offset, word, base))
+        return f"[{format_register(base)}+{offset}{'++' if post_increment else ''}]"
+
+    offset = decode_immediate(encoding.offset, word) << transfer_size
+    if post_increment:
+        if offset == 1 << transfer_size:
+            return f"[{format_register(base)}++]"
+        if offset == -(1 << transfer_size):
+            return f"[{format_register(base)}--]"
+        return f"[{format_register(base)}+{format_constant(offset)}++]"
+    if offset == 0:
+        return f"[{format_register(base)}]"
+    return f"[{format_register(base)}+{format_constant(offset)}]"
+
+def format_op(name: str, modifiers: set[str]) -> str:
+    op = name
+    for modifier in MODIFIERS:
+        if modifier == "MB" and "M" in modifiers:
+            op += "MB"
+        elif modifier in modifiers and modifier != "M":
+            op += modifier
+    return op
+
+def decode_entry(entry: DecodeEntry, word: int) -> tuple[str, list[str]]:
+    """Decode the operation and arguments of a word matching the entry"""
+    encoding = entry.encoding
+    # fields never overlap the fixed bits, clear them so they don't leak into
+    # sign bits shared with const_bits
+    fields = word & ~entry.value
+
+    # modifiers set by const_bits are implied but still needed to select
+    # this encoding when assembling again
+    modifiers = set()
+    used = set()
+    for modifier, bit in encoding.modifiers.items():
+        if word >> bit & 1 and bit not in used:
+            modifiers.add(modifier)
+            used.add(bit)
+    if encoding.L2 is not None and fields >> encoding.L2 & 1 and encoding.L2 not in used:
+        modifiers.add("D")
+    if encoding.conditional:
+        condition = field(fields, encoding.condition_base, 4)
+        if condition:
+            modifiers.add(CONDITION_NAMES[condition])
+
+    main_reg = None
+    if encoding.main_reg is not None:
+        main_reg = decode_register(encoding.args_encoding[encoding.main_reg], fields)
+        if main_reg is None:
+            return None
+
+    args = []
+    for arg_encoding in encoding.args_encoding:
+        match arg_encoding:
+            case RegisterEncoding():
+                register = decode_register(arg_encoding, fields, main_reg)
+                if register is None or (register.unit, register.number) not in REGISTER_NAMES:
+                    return None
+                args.append(format_register(register))
+            case ImmediateEncoding():
+                args.append(format_constant(decode_immediate(arg_encoding, fields)))
+            case PieceImmediateEncoding():
+                args.append(format_constant(decode_piece_immediate(arg_encoding, fields)))
+            case MemoryEncoding():
+                if arg_encoding.transfer_bits is not None:
+                    low, high = arg_encoding.transfer_bits
+                    transfer_size = (fields >> low & 1) | (fields >> high & 1) << 1
+                    modifiers.add(TRANSFER_NAMES[transfer_size])
+                else:
+                    transfer_size = arg_encoding.transfer_size
+                memory = decode_memory(arg_encoding, fields, transfer_size)
+                if memory is None:
+                    return None
+                args.append(memory)
+
+    if entry.instruction.swap_args:
+        args.reverse()
+    return format_op(entry.instruction.name, modifiers), args
+
+def encode_text(op: str, args: list[str]) -> tuple[int, int]:
+    """Encode like the assembler, returns None instead of failing"""
+    parsed = [Argument.from_str(arg) for arg in args]
+    for instruction, modifiers in lookup_instruction(op):
+        i_args = parsed[::-1] if instruction.swap_args else parsed
+        for encoding in instruction.encodings:
+            if encoding.match(i_args, modifiers):
+                size = 2 if encoding.type == EncodingType.Core else 4
+                return encoding.encode(i_args, list(modifiers)), size
+    return None
+
+@lru_cache(maxsize=65536)
+def decode(word: int, size: int) -> tuple[str, tuple[str, ...]]:
+    """Decode a 16 or 32 bit instruction word, None if it is not valid.
+
+    Only decodings which the assembler encodes to the same word are accepted.
+    """
+    for entry in DECODE_INDEX[size].candidates(word):
+        try:
+            decoded = decode_entry(entry, word)
+        except (KeyError, ValueError):
+            # field values without a register or unit
+            continue
+        if decoded is None:
+            continue
+        op, args = decoded
+        if encode_text(op, args) == (word, size):
+            return op, tuple(args)
+    return None
+
+@dataclass
+class DecodedInstruction:
+    address: int
+    size: int
+    encoded: int
+    op: str # None for words which could not be decoded
+    args: tuple[str, ...]
+
+    def target(self) -> int:
+        """Absolute target of relative branches"""
+        if self.op is None or not self.op.startswith(tuple(BRANCH_RELATIVE_INSTRUCTIONS)):
+            return None
+        for arg in self.args:
+            if arg.startswith("#"):
+                return self.address + int(arg[1:], 0)
+        return None
+
+    def text(self) -> str:
+        if self.op is None:
+            return f"! unknown 0x{self.encoded:0{self.size * 2}x}"
+        return f"{self.op} {', '.join(self.args)}".strip()
+
+    def __str__(self):
+        if self.size == 2:
+            data = f"0x{self.encoded:04x}"
+        else:
+            data = f"0x{self.encoded & 0xFFFF:04x} 0x{self.encoded >> 16:04x}"
+        comment = f"0x{self.address:04x}: {data}"
+        target = self.target()
+        if target is not None:
+            comment += f" -> 0x{target:04x}"
+        return f"    {self.text():40} ! {comment}"
+
+def disassemble(data: bytes, address: int = 0) -> Iterator[DecodedInstruction]:
+    data = memoryview(data)
+    offset = 0
+    while offset + 2 <= len(data):
+        halfword = int.from_bytes(data[offset:offset + 2], "little")
+        size = instruction_size(halfword)
+        if offset + size > len(data):
+            size = 2
+        word = int.from_bytes(data[offset:offset + size], "little")
+        decoded = decode(word, size)
+        op, args = decoded if decoded is not None else (None, ())
+        yield DecodedInstruction(address + offset, size, word, op, args)
+        offset += size
+    if offset < len(data):
+        logger.warning("Ignoring trailing byte at 0x%x", address + offset)
+
+def disassemble_source(data: bytes, address: int = 0) -> str:
+    """Disassemble an image into source accepted by the assembler"""
+    return "".join(f"{instruction}\n" for instruction in disassemble(data, address))
@@ -1,61 +1,148 @@
 import logging
-from .arguments import Argument, ArgumentType
-from .instructions import INSTRUCTIONS
+import time
+from collections import OrderedDict
+from . import profile, trace
+from .arguments import Argument, ArgumentType, parse_operands
+from .instructions import Instruction, lookup_instruction
 from .instruction_encodings import EncodingType
-from .modifiers import parse_modifiers
 
 logger = logging.getLogger(__name__)
 
+class EncodingCache:
+    """Bounded LRU cache from opcode and operand shapes to the selected encoding"""
+    maxsize: int
+    hits: int
+    misses: int
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple):
+        selected = self.entries.get(key)
+        if selected is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return selected
+
+    def put(self, key: tuple, selected: tuple):
+        self.entries[key] = selected
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"EncodingCache(size={len(self.entries)}, maxsize={self.maxsize}, hits={self.hits}, misses={self.misses})"
+
+ENCODING_CACHE = EncodingCache()
+
 class Encoder:
+    __slots__ = ("address", "op", "modifiers", "args", "encoded", "size", "label", "target", "reserved", "instruction")
     address: int
     op: str
     modifiers: list[str]
-    args: list[Argument]
+    args: tuple[Argument, ...] # shared between lines, a list of its own with a label
     encoded: int
     size: int
     label: int
+    target: Argument # the label argument, args holds its resolved value
+    reserved: int # bytes reserved in the layout for instructions with labels
+    instruction: Instruction # selected by encode
 
     def __init__(self, address: int, op: str):
         self.address = address
         self.op = op
-        self.args = []
+        self.args = ()
         self.label = None
+        self.reserved = 0
 
     def resolve_label(self, labels: dict[str, int]):
-        self.args[self.label].resolve_label(labels, self.address)
+        self.args[self.label] = self.target.resolve_label(labels, self.address)
 
     def parse_args(self, args: list[str]):
-        self.args = []
+        self.set_args(tuple(Argument.from_str(arg) for arg in args))
+
+    def parse_operands(self, text: str):
+        self.set_args(parse_operands(text))
+
+    def set_args(self, args: tuple[Argument, ...]):
+        self.args = args
         for i, arg in enumerate(args):
-            arg = Argument.from_str(arg.strip(","))
-            self.args.append(arg)
             if arg.type == ArgumentType.Label:
                 self.label = i
+                self.target = arg
+                # own copy to hold the resolved value
+                self.args = list(args)
 
-    def encode(self):
-        for instruction in INSTRUCTIONS:
-            if not self.op.startswith(instruction.name):
-                continue
-            self.modifiers = parse_modifiers(self.op[len(instruction.name):])
+    def select_encoding(self):
+        key = (self.op, *(arg.shape() for arg in self.args))
+        selected = ENCODING_CACHE.get(key)
+        if selected is not None:
+            if trace.ENABLED:
+                trace.record("select", op=self.op, instruction=selected[0].name, encoding=type(selected[2]).__name__, cached=True)
+            if profile.ENABLED:
+                profile.STATS.select(True)
+            return selected
+
+        candidates = lookup_instruction(self.op)
+        for instruction, modifiers in candidates:
             i_args = self.args[::-1] if instruction.swap_args else self.args
             for encoding in instruction.encodings:
-                if encoding.match(i_args, self.modifiers):
+                matched = encoding.match(i_args, modifiers)
+                if trace.ENABLED:
+                    trace.record("match", op=self.op, instruction=instruction.name, encoding=type(encoding).__name__, const_bits=encoding.const_bits, args=i_args, matched=matched)
+                if profile.ENABLED:
+                    profile.STATS.attempt(instruction.name, type(encoding).__name__, matched)
+                if matched:
                     break
             else:
-                logger.debug("Found no encoding for %s in %s, trying other instructions", self.op, instruction)
+                if trace.ENABLED:
+                    trace.log(logger, "reject", "Found no encoding for %s in %s, trying other instructions", self.op, instruction)
                 continue
             break
         else:
             logger.critical(f"Found no encoding for {self.op} with args {self.args}")
             exit()
 
+        selected = (instruction, modifiers, encoding)
+        if trace.ENABLED:
+            trace.record("select", op=self.op, instruction=instruction.name, encoding=type(encoding).__name__, cached=False)
+        if profile.ENABLED:
+            profile.STATS.select(False)
+        if all(e.shape_cacheable for candidate, _ in candidates for e in candidate.encodings):
+            ENCODING_CACHE.put(key, selected)
+        return selected
+
+    def encode(self):
+        if profile.ENABLED:
+            start = time.perf_counter()
+        instruction, modifiers, encoding = self.select_encoding()
+        if profile.ENABLED:
+            start = profile.STATS.step("select", start)
+        self.instruction = instruction
+        self.modifiers = list(modifiers)
+        i_args = self.args[::-1] if instruction.swap_args else self.args
+
         #print("Choose encoding", encoding)
         self.encoded = encoding.encode(i_args, self.modifiers)
+        if profile.ENABLED:
+            profile.STATS.step("encode", start)
         if encoding.type == EncodingType.Core:
-            logger.debug("Encoding Core: 0x%x", self.encoded)
+            if trace.ENABLED:
+                trace.log(logger, "encode", "Encoding Core: 0x%x", self.encoded)
             self.size = 2
         else:
-            logger.debug("Encoding Extended: 0x%x 0x%x", self.encoded & 0xFFFF, self.encoded >> 16)
+            if trace.ENABLED:
+                trace.log(logger, "encode", "Encoding Extended: 0x%x 0x%x", self.encoded & 0xFFFF, self.encoded >> 16)
             self.size = 4
 
     def __repr__(self):
@@ -64,3 +151,13 @@ class Encoder:
         else:
             data = f"0x{self.encoded & 0xFFFF:04x} 0x{self.encoded >> 16:04x}"
         return f"0x{self.address:04x}: {data:13} {self.op} {self.modifiers} {self.args}"
+
+class Padding(Encoder):
+    """NOP aligning the following instruction to 4 bytes.
+
+    The size is set to 0 or 2 during layout depending on the address.
+    """
+
+    def __init__(self, address: int):
+        super().__init__(address, "NOP")
+        self.encode()
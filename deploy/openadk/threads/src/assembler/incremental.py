@@ -0,0 +1,69 @@
+import logging
+from . import Assembler
+from .encoder import Encoder
+
+logger = logging.getLogger(__name__)
+
+class IncrementalAssembler(Assembler):
+    """Assembler reusing the results of the previous run for unchanged lines.
+
+    Instructions without a label encode the same regardless of their address,
+    so their encoder is kept by op and operand text and reused as long as the line
+    exists. Only new or edited lines are parsed and encoded again. Addresses,
+    alignment paddings and labels are recomputed by the layout on every run,
+    which shifts all code after an edit. Instructions with a label remember
+    the value they were encoded for and are only encoded again if it changed.
+    """
+    previous: dict[tuple[str, str], list[Encoder]]
+    current: dict[tuple[str, str], list[Encoder]]
+    resolved: dict[Encoder, int]
+    reused: int
+
+    def __init__(self):
+        super().__init__()
+        self.previous = {}
+        self.resolved = {}
+
+    def process_instruction(self, op: str, args: str):
+        line = (op, args)
+        encoders = self.previous.get(line)
+        if encoders:
+            encoder = encoders.pop()
+            encoder.address = self.cursor
+            self.instructions.append(encoder)
+            if encoder.label is None:
+                self.cursor += encoder.size
+            else:
+                # relax again from the shortest encoding like a fresh run
+                encoder.reserved = 2
+                self.cursor += encoder.reserved
+            self.reused += 1
+        else:
+            super().process_instruction(op, args)
+            encoder = self.instructions[-1]
+        self.current.setdefault(line, []).append(encoder)
+
+    def encode_label(self, instruction: Encoder):
+        instruction.resolve_label(self.labels)
+        value = instruction.args[instruction.label].constant
+        if self.resolved.get(instruction) == value:
+            return
+        instruction.encode()
+        self.resolved[instruction] = value
+
+    def reset(self):
+        super().reset()
+        self.current = {}
+        self.reused = 0
+
+    def assemble(self, assembly: str):
+        super().assemble(assembly)
+        # encoders of lines removed in this run are dropped
+        self.previous = self.current
+        self.resolved = {
+            encoder: value
+            for encoders in self.current.values()
+            for encoder in encoders
+            if (value := self.resolved.get(encoder)) is not None
+            }
+        logger.debug("Reused %d of %d instructions", self.reused, sum(map(len, self.current.values())))
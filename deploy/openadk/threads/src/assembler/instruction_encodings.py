@@ -1,7 +1,9 @@
 import logging
 from enum import Enum, auto
+from . import trace
 from .argument_encodings import RegisterEncoding, ImmediateEncoding, MemoryEncoding, PieceImmediateEncoding
-from .constraints import UnitConstraint
+from .codegen import compile_match, compile_encode
+from .constraints import UnitConstraint, PieceImmConstraint
 from .modifiers import CONDITION_MAP, TRANSFER_MAP, gen_conditional
 from .registers import REGISTERS
 
@@ -12,16 +14,38 @@ class EncodingType(Enum):
     Extended = auto()
     Long = auto()
 
+class Generated:
+    """Class attribute created by gen_constraints on first access.
+
+    Compiling the constraints of every encoding dominated the import time,
+    while a program only uses a few of them. gen_constraints stores the real
+    values on the encoding class, which shadow this descriptor afterwards.
+    """
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if owner is Encoding:
+            raise AttributeError(self.name)
+        owner.gen_constraints()
+        return getattr(owner if instance is None else instance, self.name)
+
 class Encoding:
     const_bits: int
     args_encoding: list = []
-    constraints: list
+    constraints: list = Generated()
     modifiers: dict[str, int] = None
     main_reg: int = None
     conditional: bool = False
     condition_base: int = None
     L2: int = None
     type: EncodingType
+    shape_cacheable: bool = Generated()
+    compiled_match = Generated()
+    compiled_encode = Generated()
+    # use the generic constraint and argument encoding classes instead of the
+    # functions compiled by gen_constraints, for comparing outputs
+    reference: bool = False
 
     def __init__(self, const_bits: int, modifiers: list[str] = None, cc: bool = False):
         self.const_bits = const_bits
@@ -52,10 +76,31 @@ class Encoding:
         main_reg = cls.args_encoding[cls.main_reg] if cls.main_reg is not None else None
         for encoding in cls.args_encoding:
             cls.constraints.append(encoding.constraint(main_reg))
+        # piece constraints depend on the exact bits of the value, not only its shape
+        cls.shape_cacheable = not any(isinstance(constraint, PieceImmConstraint) for constraint in cls.constraints)
+        cls.compiled_match = staticmethod(compile_match(cls))
+        cls.compiled_encode = staticmethod(compile_encode(cls))
 
     def match(self, args: list["Argument"], modifiers: list[str]):
+        if self.reference:
+            matched = self.match_args(args, modifiers)
+        else:
+            matched = self.compiled_match(args, modifiers)
+        if not matched:
+            return False
+
+        for modifier in modifiers:
+            if not (modifier in self.modifiers or modifier in TRANSFER_MAP or (self.conditional and modifier in CONDITION_MAP)):
+                if trace.ENABLED:
+                    trace.log(logger, "reject", "Match encoding failed, non matching modifier: %s", modifier)
+                return False
+
+        return True
+
+    def match_args(self, args: list["Argument"], modifiers: list[str]):
         if len(self.constraints) != len(args):
-            logger.debug("Match encoding failed, wrong arg num")
+            if trace.ENABLED:
+                trace.log(logger, "reject", "Match encoding failed, wrong arg num")
             return False
         main_reg = None
         if self.main_reg is not None:
@@ -69,20 +114,22 @@ class Encoding:
                 continue
             if not constraint.match(arg, modifiers, main_reg):
                 return False
-
-        for modifier in modifiers:
-            if not (modifier in self.modifiers or modifier in TRANSFER_MAP or (self.conditional and modifier in CONDITION_MAP)):
-                logger.debug("Match encoding failed, non matching modifier: %s", modifier)
-                return False
-
         return True
 
-    def encode(self, args: list["Argument"], modifiers: list[str]):
+    def encode_args(self, args: list["Argument"], modifiers: list[str]):
         assert len(args) == len(self.args_encoding)
-        encoded_val = self.const_bits
+        encoded_val = 0
         main_reg = args[self.main_reg].register if self.main_reg is not None else None
         for arg, encoding in zip(args, self.args_encoding):
             encoded_val |= encoding.encode(arg, modifiers, main_reg)
+        return encoded_val
+
+    def encode(self, args: list["Argument"], modifiers: list[str]):
+        encoded_val = self.const_bits
+        if self.reference:
+            encoded_val |= self.encode_args(args, modifiers)
+        else:
+            encoded_val |= self.compiled_encode(args, modifiers)
 
         for modifier in modifiers:
             if modifier in TRANSFER_MAP:
@@ -638,8 +685,9 @@ class EncodingN(Encoding):
 class EncodingNe(Encoding):
     type = EncodingType.Extended
 
-classes = []
-k = v = None
-for k, v in locals().items():
-    if k.startswith("Encoding") and k not in ["Encoding", "EncodingType"]:
-        v.gen_constraints()
+
+def gen_all_constraints():
+    """Compile every encoding now instead of on first use, e.g. before forking"""
+    for cls in Encoding.__subclasses__():
+        if "constraints" not in cls.__dict__:
+            cls.gen_constraints()
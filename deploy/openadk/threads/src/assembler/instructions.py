@@ -1,5 +1,7 @@
 from dataclasses import dataclass
+from functools import lru_cache
 from .instruction_encodings import *
+from .modifiers import parse_modifiers
 
 BRANCH_RELATIVE_INSTRUCTIONS = ["B", "CALLR"]
 
@@ -302,3 +304,43 @@ INSTRUCTIONS = [
         ]
     ),
 ]
+
+
+def build_trie(instructions: list[Instruction]) -> dict:
+    """Build a prefix trie over the instruction names.
+
+    Every node maps a character to its child node, the key None holds the
+    indices of the instructions whose name ends at this node.
+    """
+    trie = {}
+    for index, instruction in enumerate(instructions):
+        node = trie
+        for char in instruction.name:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(index)
+    return trie
+
+INSTRUCTION_TRIE = build_trie(INSTRUCTIONS)
+
+@lru_cache(maxsize=1024)
+def lookup_instruction(op: str) -> tuple[tuple[Instruction, tuple[str, ...]], ...]:
+    """Return all (instruction, modifiers) candidates for an opcode.
+
+    Candidates are all instructions whose name is a prefix of op, in the order
+    of INSTRUCTIONS, so e.g. GETD is tried before GET with a D modifier.
+    """
+    indices = []
+    node = INSTRUCTION_TRIE
+    for depth in range(len(op) + 1):
+        for index in node.get(None, ()):
+            indices.append((index, depth))
+        if depth == len(op):
+            break
+        node = node.get(op[depth])
+        if node is None:
+            break
+    indices.sort()
+    return tuple(
+        (INSTRUCTIONS[index], tuple(parse_modifiers(op[depth:])))
+        for index, depth in indices
+    )
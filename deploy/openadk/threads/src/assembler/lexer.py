@@ -0,0 +1,86 @@
+import logging
+import re
+from enum import Enum, auto
+from .registers import REGISTERS
+
+logger = logging.getLogger(__name__)
+
+# Single pass tokenizer for operands.
+#
+# OPERAND.findall returns one tuple per operand with the groups below, the
+# non-empty one tells the type:
+#  - part, part_value: #HI(...) or #LO(...)
+#  - number: hex or decimal immediate
+#  - symbol: any other immediate, a label
+#  - base, offset, increment: memory operand [base+offset] with optional ++/--
+#  - word: register or label, told apart by a lookup in REGISTERS
+#  - invalid: a character no operand can start with
+# Operands are separated by commas and/or whitespace. Numbers and labels are
+# told apart by the pattern, so labels don't cost a failed int().
+
+OPERAND = re.compile(r"""
+    \#(?:
+        (?P<part>HI|LO)\((?P<part_value>[^)]*)\)
+        |(?P<number>0x[0-9a-fA-F]+|[+-]?[0-9]+)(?![^\s,])
+        |(?P<symbol>[^\s,]+)
+    )
+    |\[(?P<base>[^\]+\-\s]+)(?:\+(?P<offset>[^\]+\-][^\]]*?))?(?P<increment>\+\+|--)?\]
+    |(?P<word>[^\s,\[\#]+)
+    |(?P<invalid>[^\s,])
+    """, re.VERBOSE)
+
+NUMBER = re.compile(r"0x[0-9a-fA-F]+|[+-]?[0-9]+")
+
+class TokenType(Enum):
+    Register = 1
+    Immediate = auto()
+    Label = auto()
+    Memory = auto()
+
+# (Register, register), (Immediate, value), (Label, name, part) with part
+# None, "HI" or "LO", (Memory, base, offset token, post_increment)
+Token = tuple
+
+def parse_number(number: str) -> int:
+    return int(number, 16) if "x" in number else int(number)
+
+def immediate(value: str, part: str = None) -> Token:
+    if NUMBER.fullmatch(value):
+        value = parse_number(value)
+        if part == "HI":
+            value >>= 16
+        elif part == "LO":
+            value &= 0xFFFF
+        return (TokenType.Immediate, value)
+    return (TokenType.Label, value, part)
+
+def tokenize(text: str) -> tuple[Token, ...]:
+    tokens = []
+    for part, part_value, number, symbol, base, offset, increment, word, invalid in OPERAND.findall(text):
+        if word:
+            register = REGISTERS.get(word)
+            tokens.append((TokenType.Register, register) if register is not None else (TokenType.Label, word, None))
+        elif number:
+            tokens.append((TokenType.Immediate, parse_number(number)))
+        elif base:
+            register = REGISTERS.get(base)
+            if register is None:
+                logger.critical("Invalid base register %s", base)
+                exit()
+            if offset:
+                offset_tokens = tokenize(offset)
+                if len(offset_tokens) != 1 or offset_tokens[0][0] == TokenType.Memory:
+                    logger.critical("Invalid offset %s", offset)
+                    exit()
+                offset = offset_tokens[0]
+            else:
+                offset = (TokenType.Immediate, -1 if increment == "--" else 1 if increment else 0)
+            tokens.append((TokenType.Memory, register, offset, bool(increment)))
+        elif part:
+            tokens.append(immediate(part_value, part))
+        elif symbol:
+            tokens.append((TokenType.Label, symbol, None))
+        else:
+            logger.critical("Unexpected %s in operands %s", invalid, text)
+            exit()
+    return tuple(tokens)
@@ -0,0 +1,69 @@
+import logging
+from . import PACK_FORMATS
+from .encoder import Encoder
+from .objects import ObjectFile
+
+logger = logging.getLogger(__name__)
+
+class Linker:
+    """Combine objects into one image and resolve the symbols between them.
+
+    Sections are placed in the order of the objects, each aligned as requested
+    with NOPs in between. Exported symbols are global and must be unique, all
+    other labels stay local to their object. Relocated instructions are
+    encoded again at their final address and padded with a NOP to the 4 bytes
+    they reserve.
+    """
+    image: bytearray
+    symbols: dict[str, int]
+    bases: list[dict[str, int]] # address of every section of each object
+    nop: bytes
+
+    def __init__(self):
+        self.image = bytearray()
+        self.symbols = {}
+        self.bases = []
+        nop = Encoder(0, "NOP")
+        nop.encode()
+        self.nop = PACK_FORMATS[nop.size].pack(nop.encoded)
+
+    def place(self, obj: ObjectFile):
+        bases = {}
+        for section in obj.sections:
+            while len(self.image) % section.align:
+                self.image += self.nop
+            bases[section.name] = len(self.image)
+            self.image += section.data
+        self.bases.append(bases)
+        for name in obj.exports:
+            if name in self.symbols:
+                logger.critical("Symbol %s of %s is already defined", name, obj.name)
+                exit()
+            section, offset = obj.symbols[name]
+            self.symbols[name] = bases[section] + offset
+
+    def relocate(self, obj: ObjectFile, bases: dict[str, int]):
+        for relocation in obj.relocations:
+            address = bases[relocation.section] + relocation.offset
+            value = self.symbols.get(relocation.symbol)
+            if value is None:
+                logger.critical("Undefined symbol %s referenced in %s at 0x%x", relocation.symbol, obj.name, relocation.offset)
+                exit()
+            encoder = Encoder(address, relocation.op)
+            encoder.parse_operands(relocation.operands)
+            encoder.resolve_label({relocation.symbol: value})
+            encoder.encode()
+            PACK_FORMATS[encoder.size].pack_into(self.image, address, encoder.encoded)
+            if encoder.size == 2:
+                self.image[address + 2:address + 4] = self.nop
+
+    def link(self, objects: list[ObjectFile]) -> bytearray:
+        for obj in objects:
+            self.place(obj)
+        for obj, bases in zip(objects, self.bases):
+            self.relocate(obj, bases)
+        return self.image
+
+def link(objects: list[ObjectFile]) -> tuple[bytearray, dict[str, int]]:
+    linker = Linker()
+    return linker.link(objects), linker.symbols
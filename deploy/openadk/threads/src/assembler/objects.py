@@ -0,0 +1,167 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from enum import Enum, auto
+from . import Assembler
+from .arguments import ExtractBits
+from .encoder import Encoder
+from .instructions import BRANCH_RELATIVE_INSTRUCTIONS
+
+logger = logging.getLogger(__name__)
+
+# Relocatable object files.
+#
+# All label values are pc relative, so references to labels of the same
+# object don't change when the linker moves it and are resolved by the
+# assembler as usual. Only references to symbols of other objects become
+# relocations. Such an instruction reserves 4 bytes like a forward reference
+# of the streaming assembler and the relocation keeps its op and operand text,
+# the linker encodes it again once the address of the symbol is known.
+#
+# Objects are stored as JSON with the section contents in hex.
+
+OBJECT_FORMAT = "minim-object"
+OBJECT_VERSION = 1
+# objects are placed at 4 byte aligned addresses, so the alignment paddings
+# chosen by the assembler stay valid
+SECTION_ALIGN = 4
+
+class RelocationType(Enum):
+    Branch = 1 # displacement of B or CALLR
+    Relative = auto() # pc relative value of the symbol
+    High = auto() # #HI(symbol)
+    Low = auto() # #LO(symbol)
+
+@dataclass
+class Relocation:
+    section: str
+    offset: int # of the instruction in the section
+    op: str
+    operands: str
+    symbol: str
+    type: RelocationType
+
+@dataclass
+class Section:
+    name: str
+    data: bytes
+    align: int = SECTION_ALIGN
+
+@dataclass
+class ObjectFile:
+    name: str
+    sections: list[Section] = field(default_factory=list)
+    symbols: dict[str, tuple[str, int]] = field(default_factory=dict) # name -> section, offset
+    exports: list[str] = field(default_factory=list)
+    relocations: list[Relocation] = field(default_factory=list)
+
+    def dump(self, file):
+        json.dump(self.to_json(), file)
+
+    def dumps(self) -> bytes:
+        # the assembly cache stores objects like images
+        return json.dumps(self.to_json()).encode()
+
+    def to_json(self) -> dict:
+        return {
+            "format": OBJECT_FORMAT,
+            "version": OBJECT_VERSION,
+            "name": self.name,
+            "sections": [{"name": s.name, "align": s.align, "data": s.data.hex()} for s in self.sections],
+            "symbols": self.symbols,
+            "exports": self.exports,
+            "relocations": [{**vars(r), "type": r.type.name} for r in self.relocations],
+            }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "ObjectFile":
+        if data.get("format") != OBJECT_FORMAT or data.get("version") != OBJECT_VERSION:
+            logger.critical("%s is not a version %d object file", data.get("name", "input"), OBJECT_VERSION)
+            exit()
+        return cls(
+            data["name"],
+            [Section(s["name"], bytes.fromhex(s["data"]), s["align"]) for s in data["sections"]],
+            {name: tuple(value) for name, value in data["symbols"].items()},
+            data["exports"],
+            [Relocation(**{**r, "type": RelocationType[r["type"]]}) for r in data["relocations"]],
+            )
+
+    @classmethod
+    def loads(cls, data: bytes) -> "ObjectFile":
+        return cls.from_json(json.loads(data))
+
+    @classmethod
+    def load(cls, path: str) -> "ObjectFile":
+        with open(path) as f:
+            try:
+                data = json.load(f)
+            except ValueError:
+                logger.critical("%s is not an object file", path)
+                exit()
+        return cls.from_json(data)
+
+def relocation_type(encoder: Encoder) -> RelocationType:
+    match encoder.target.extract_bits:
+        case ExtractBits.Top:
+            return RelocationType.High
+        case ExtractBits.Bottom:
+            return RelocationType.Low
+    if encoder.op.startswith(tuple(BRANCH_RELATIVE_INSTRUCTIONS)):
+        return RelocationType.Branch
+    return RelocationType.Relative
+
+class ObjectAssembler(Assembler):
+    """Assembler producing a relocatable object instead of a flat image.
+
+    Labels are local to the object unless exported with ".global name".
+    References to labels not defined in the source are left to the linker.
+    """
+    exports: list[str]
+    operands: dict[Encoder, str] # operand text of instructions with a label
+
+    def reset(self):
+        super().reset()
+        self.exports = []
+        self.operands = {}
+
+    def process_command(self, command: str, args: list[str]):
+        if command == "global":
+            self.exports.extend(name for arg in args for name in arg.split(",") if name)
+            return
+        super().process_command(command, args)
+
+    def process_instruction(self, op: str, args: str):
+        super().process_instruction(op, args)
+        encoder = self.instructions[-1]
+        if encoder.label is not None:
+            self.operands[encoder] = args
+
+    def is_external(self, instruction: Encoder) -> bool:
+        return instruction.target.name not in self.labels
+
+    def encode_label(self, instruction: Encoder):
+        if not self.is_external(instruction):
+            super().encode_label(instruction)
+            return
+        # placeholder of the largest size, encoded by the linker
+        instruction.encoded = 0
+        instruction.modifiers = []
+        instruction.size = 4
+
+    def to_object(self, name: str) -> ObjectFile:
+        for export in self.exports:
+            if export not in self.labels:
+                logger.critical("Exported label %s is not defined", export)
+                exit()
+        relocations = [
+            Relocation("text", instruction.address, instruction.op, self.operands[instruction], instruction.target.name, relocation_type(instruction))
+            for instruction in self.instructions
+            if instruction.label is not None and self.is_external(instruction)
+            ]
+        return ObjectFile(
+            name,
+            [Section("text", bytes(self.encoded))],
+            {label: ("text", address) for label, address in self.labels.items()},
+            self.exports,
+            relocations,
+            )
@@ -0,0 +1,140 @@
+import re
+import struct
+from typing import BinaryIO
+
+# Output formats for embedding the encoded image without extra build steps.
+#
+# Every writer gets the encoded buffer, the labels and a name used for the
+# symbols and writes the file in one pass over the buffer. Labels become
+# symbols <name>_<label> in the C header and the ELF object. Intel HEX and
+# S-records have no symbols, they are meant for loaders and flash tools.
+
+# bytes per data record of Intel HEX and S-records
+RECORD_SIZE = 16
+# halfwords per line of the C header
+HEADER_COLUMNS = 8
+
+def symbol_name(name: str) -> str:
+    """C identifier for a file or label name"""
+    name = re.sub(r"\W", "_", name)
+    return "_" + name if name[:1].isdigit() else name
+
+def write_bin(output: BinaryIO, encoded: memoryview, labels: dict[str, int], name: str):
+    output.write(encoded)
+
+def write_c_header(output: BinaryIO, encoded: memoryview, labels: dict[str, int], name: str):
+    # same layout as enc_key.h, halfwords because MiniM instructions are made of them
+    name = symbol_name(name)
+    lines = [f"#define {name.upper()}_SIZE {len(encoded)}"]
+    lines.extend(f"#define {symbol_name(f'{name}_{label}').upper()} 0x{address:04x}" for label, address in labels.items())
+    lines.append(f"static const uint16_t {name}[{len(encoded) // 2}] __attribute__ ((aligned(4))) = {{")
+    halfwords = encoded.cast("H")
+    for start in range(0, len(halfwords), HEADER_COLUMNS):
+        lines.append("\t" + " ".join(f"0x{halfword:04x}," for halfword in halfwords[start:start + HEADER_COLUMNS]))
+    lines.append("};")
+    output.write(("\n".join(lines) + "\n").encode())
+
+def ihex_record(address: int, type: int, data: bytes) -> bytes:
+    record = bytes((len(data), address >> 8 & 0xff, address & 0xff, type)) + data
+    return f":{record.hex().upper()}{-sum(record) & 0xff:02X}\n".encode()
+
+def write_ihex(output: BinaryIO, encoded: memoryview, labels: dict[str, int], name: str):
+    segment = 0
+    for address in range(0, len(encoded), RECORD_SIZE):
+        if address >> 16 != segment:
+            # extended linear address for images beyond 64 KiB
+            segment = address >> 16
+            output.write(ihex_record(0, 4, segment.to_bytes(2, "big")))
+        output.write(ihex_record(address & 0xffff, 0, encoded[address:address + RECORD_SIZE]))
+    output.write(ihex_record(0, 1, b""))
+
+def srec_record(type: int, address: int, address_size: int, data: bytes) -> bytes:
+    record = bytes((address_size + len(data) + 1,)) + address.to_bytes(address_size, "big") + data
+    return f"S{type}{record.hex().upper()}{~sum(record) & 0xff:02X}\n".encode()
+
+def write_srec(output: BinaryIO, encoded: memoryview, labels: dict[str, int], name: str):
+    # S1/S9 with 16 bit addresses if possible, S3/S7 with 32 bit otherwise
+    data_type, end_type, address_size = (1, 9, 2) if len(encoded) <= 0x10000 else (3, 7, 4)
+    output.write(srec_record(0, 0, 2, name.encode()[:64]))
+    count = 0
+    for address in range(0, len(encoded), RECORD_SIZE):
+        output.write(srec_record(data_type, address, address_size, encoded[address:address + RECORD_SIZE]))
+        count += 1
+    if count < 0x10000:
+        output.write(srec_record(5, count, 2, b""))
+    output.write(srec_record(end_type, 0, address_size, b""))
+
+# ELF32 little endian relocatable object, EM_METAG
+ELF_HEADER = struct.Struct("<16sHHIIIIIHHHHHH")
+SECTION_HEADER = struct.Struct("<IIIIIIIIII")
+SYMBOL = struct.Struct("<IIIBBH")
+EM_METAG = 174
+ET_REL = 1
+SHT_PROGBITS, SHT_SYMTAB, SHT_STRTAB = 1, 2, 3
+SHF_ALLOC, SHF_EXECINSTR = 2, 4
+STB_LOCAL, STB_GLOBAL = 0, 1
+STT_NOTYPE, STT_FUNC, STT_SECTION = 0, 2, 3
+ELF_SECTION = ".minim.text"
+
+class StringTable:
+    data: bytearray
+    offsets: dict[str, int]
+
+    def __init__(self):
+        self.data = bytearray(1)
+        self.offsets = {"": 0}
+
+    def add(self, name: str) -> int:
+        offset = self.offsets.get(name)
+        if offset is None:
+            offset = self.offsets[name] = len(self.data)
+            self.data += name.encode() + b"\0"
+        return offset
+
+def align4(value: int) -> int:
+    return (value + 3) & ~3
+
+def write_elf(output: BinaryIO, encoded: memoryview, labels: dict[str, int], name: str):
+    name = symbol_name(name)
+    strings = StringTable()
+    # section symbol first, the locals must come before the globals
+    symbols = [SYMBOL.pack(0, 0, 0, 0, 0, 0), SYMBOL.pack(0, 0, 0, STB_LOCAL << 4 | STT_SECTION, 0, 1)]
+    symbols.append(SYMBOL.pack(strings.add(name), 0, len(encoded), STB_GLOBAL << 4 | STT_FUNC, 0, 1))
+    symbols.append(SYMBOL.pack(strings.add(f"{name}_end"), len(encoded), 0, STB_GLOBAL << 4 | STT_NOTYPE, 0, 1))
+    for label, address in labels.items():
+        symbols.append(SYMBOL.pack(strings.add(symbol_name(f"{name}_{label}")), address, 0, STB_GLOBAL << 4 | STT_NOTYPE, 0, 1))
+    symtab = b"".join(symbols)
+    section_names = StringTable()
+    names = [section_names.add(section) for section in (ELF_SECTION, ".symtab", ".strtab", ".shstrtab")]
+
+    # header, image, symbols, strings, section names, section headers
+    image_offset = ELF_HEADER.size
+    symtab_offset = align4(image_offset + len(encoded))
+    strtab_offset = symtab_offset + len(symtab)
+    shstrtab_offset = strtab_offset + len(strings.data)
+    headers_offset = align4(shstrtab_offset + len(section_names.data))
+    sections = [
+        SECTION_HEADER.pack(0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+        SECTION_HEADER.pack(names[0], SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR, 0, image_offset, len(encoded), 0, 0, 4, 0),
+        # link to the string table, info is the first global symbol
+        SECTION_HEADER.pack(names[1], SHT_SYMTAB, 0, 0, symtab_offset, len(symtab), 3, 2, 4, SYMBOL.size),
+        SECTION_HEADER.pack(names[2], SHT_STRTAB, 0, 0, strtab_offset, len(strings.data), 0, 0, 1, 0),
+        SECTION_HEADER.pack(names[3], SHT_STRTAB, 0, 0, shstrtab_offset, len(section_names.data), 0, 0, 1, 0),
+        ]
+    ident = b"\x7fELF" + bytes((1, 1, 1))
+    output.write(ELF_HEADER.pack(ident, ET_REL, EM_METAG, 1, 0, 0, headers_offset, 0, ELF_HEADER.size, 0, 0, SECTION_HEADER.size, len(sections), 4))
+    output.write(encoded)
+    output.write(bytes(symtab_offset - image_offset - len(encoded)))
+    output.write(symtab)
+    output.write(strings.data)
+    output.write(section_names.data)
+    output.write(bytes(headers_offset - shstrtab_offset - len(section_names.data)))
+    output.write(b"".join(sections))
+
+FORMATS = {
+    "bin": write_bin,
+    "c": write_c_header,
+    "elf": write_elf,
+    "ihex": write_ihex,
+    "srec": write_srec,
+    }
@@ -0,0 +1,93 @@
+import time
+from collections import Counter
+
+# Opt-in profiling of the assembler.
+#
+# Like trace, every hook is guarded with "if profile.ENABLED:", so with
+# profiling disabled the hot paths only pay for the check. When enabled STATS
+# collects:
+#  - the time of the top level phases: lines (parsing and encoding every
+#    line), fill_labels and create_encoded
+#  - the time spent parsing operands, selecting an encoding (matching) and
+#    encoding, these are part of the phases above
+#  - match attempts per instruction and failed matches per encoding class
+
+ENABLED = False
+
+PHASES = ("lines", "fill_labels", "create_encoded")
+STEPS = ("parse", "select", "encode")
+
+class Stats:
+    phases: dict[str, float]
+    steps: dict[str, float]
+    attempts: Counter # instruction name -> match attempts
+    failures: Counter # encoding class -> failed matches
+    selections: int
+    cache_hits: int
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.steps = dict.fromkeys(STEPS, 0.0)
+        self.attempts = Counter()
+        self.failures = Counter()
+        self.selections = 0
+        self.cache_hits = 0
+
+    def phase(self, name: str, start: float) -> float:
+        """Add the time since start to a phase, returns the current time"""
+        now = time.perf_counter()
+        self.phases[name] += now - start
+        return now
+
+    def step(self, name: str, start: float) -> float:
+        now = time.perf_counter()
+        self.steps[name] += now - start
+        return now
+
+    def attempt(self, instruction: str, encoding: str, matched: bool):
+        self.attempts[instruction] += 1
+        if not matched:
+            self.failures[encoding] += 1
+
+    def select(self, cached: bool):
+        self.selections += 1
+        self.cache_hits += cached
+
+    def as_dict(self) -> dict:
+        return {
+            "phases": self.phases,
+            "steps": self.steps,
+            "attempts": dict(self.attempts),
+            "failures": dict(self.failures),
+            "selections": self.selections,
+            "cache_hits": self.cache_hits,
+            }
+
+    def table(self, top: int = 10) -> str:
+        total = sum(self.phases.values()) or 1e-9
+        lines = [f"{'phase':<24} {'ms':>10} {'%':>6}"]
+        for name, seconds in self.phases.items():
+            lines.append(f"{name:<24} {seconds * 1000:10.2f} {seconds / total * 100:6.1f}")
+        for name, seconds in self.steps.items():
+            lines.append(f"  {name:<22} {seconds * 1000:10.2f} {seconds / total * 100:6.1f}")
+        lines.append("")
+        lines.append(f"{self.selections} encoding selections, {self.cache_hits} from the cache")
+        lines.append(f"{'instruction':<24} {'attempts':>10}")
+        lines.extend(f"{name:<24} {count:10d}" for name, count in self.attempts.most_common(top))
+        lines.append(f"{'encoding':<24} {'failures':>10}")
+        lines.extend(f"{name:<24} {count:10d}" for name, count in self.failures.most_common(top))
+        return "\n".join(lines)
+
+STATS = Stats()
+
+def enable() -> Stats:
+    """Start collecting into a fresh STATS"""
+    global ENABLED, STATS
+    ENABLED = True
+    STATS = Stats()
+    return STATS
+
+def disable() -> Stats:
+    global ENABLED
+    ENABLED = False
+    return STATS
@@ -18,6 +18,7 @@ DATA_UNITS = set((RegUnits.Data0, RegUnits.Data1))
 
 
 class Register:
+    __slots__ = ("unit", "number")
     unit: RegUnits
     number: int
 
@@ -0,0 +1,763 @@
+import bisect
+import logging
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable
+from .arguments import Argument, ArgumentType
+from .disassembler import decode, instruction_size
+from .encoder import Encoder
+from .modifiers import CONDITION_MAP, TRANSFER_MAP
+from .registers import CONTROL_REGS, RegUnits, Register
+
+logger = logging.getLogger(__name__)
+
+# Instruction set simulator for the MiniM code of the threads challenge.
+#
+# It executes the Encoder objects of an assembled program against a flat
+# memory and counts instructions and estimated cycles per label region.
+# The semantics cover what encrypt.s relies on and solution/decrypt.c inverts:
+#  - DSP instructions (P modifier, DSPMUL, DSPMUL8) run on both data units
+#    when DUARITHMODE in TXMODE is set. In split 16 mode immediates and shifts
+#    apply to each 16 bit half and DSPMUL multiplies the halves as 8.8 fixed
+#    point numbers, with C as complex numbers (real in the top half).
+#    In 32x32 mode DSPMUL keeps the low 32 bits of the product.
+#  - Post increments and ADD/SUB on address registers follow the address mode
+#    of their unit, modulo TXMRSIZE or bit reversed.
+#  - BR decrements TXRPT and branches while it was not zero.
+# Cycle counts are rough estimates, good for comparing versions of a kernel.
+#
+# By default the program is executed in basic blocks. Every block is
+# translated once into a list of closures with the operands already looked
+# up, counters are updated once per block, and blocks looping on themselves
+# with BR run as a plain python loop for all TXRPT iterations. If the program
+# is also placed in memory (code_base), stores to it invalidate the affected
+# blocks and the instructions are decoded again from memory.
+
+MASK32 = 0xffffffff
+
+TXMODE = CONTROL_REGS["TXMODE"].number
+TXRPT = CONTROL_REGS["TXRPT"].number
+TXMRSIZE = CONTROL_REGS["TXMRSIZE"].number
+
+DUARITH_SPLIT16 = 1
+
+ADDRMODE_MODULO = 3
+ADDRMODE_BITREV = 4
+
+# estimated cycles, everything not listed takes one cycle
+CYCLES = {
+    "GET": 2,
+    "GETD": 2,
+    "MUL": 2,
+    "DSPMUL": 2,
+    "DSPMUL8": 2,
+    }
+TAKEN_BRANCH_CYCLES = 2
+# repeat branches are predicted taken
+TAKEN_REPEAT_CYCLES = 0
+
+def signed(value: int) -> int:
+    return value - (1 << 32) if value & 0x80000000 else value
+
+def signed16(value: int) -> int:
+    return value - (1 << 16) if value & 0x8000 else value
+
+def bitreverse(value: int) -> int:
+    return int(f"{value & MASK32:032b}"[::-1], 2)
+
+def bitrev_add(a: int, b: int) -> int:
+    return bitreverse(bitreverse(a) + bitreverse(b))
+
+def split16(value: int, op) -> int:
+    """Apply op to both 16 bit halves"""
+    return (op(value >> 16) & 0xffff) << 16 | (op(value & 0xffff) & 0xffff)
+
+def mul_fixed(a: int, b: int) -> int:
+    # 8.8 fixed point multiplication of 16 bit halves
+    return (a * b) >> 16
+
+def condition_holds(condition: int, flags: "Flags") -> bool:
+    match condition:
+        case 0:
+            return True
+        case 1:
+            return flags.z
+        case 2:
+            return not flags.z
+        case 3:
+            return flags.c
+        case 4:
+            return not flags.c
+        case 5:
+            return flags.n
+        case 6:
+            return not flags.n
+        case 7:
+            return flags.v
+        case 8:
+            return not flags.v
+        case 9:
+            return not flags.c and not flags.z
+        case 10:
+            return flags.c or flags.z
+        case 11:
+            return flags.n == flags.v
+        case 12:
+            return flags.n != flags.v
+        case 13:
+            return not flags.z and flags.n == flags.v
+        case 14:
+            return flags.z or flags.n != flags.v
+    return False
+
+@dataclass
+class Flags:
+    z: bool = False
+    n: bool = False
+    c: bool = False # borrow for subtractions, so CS is LO
+    v: bool = False
+
+    def set_logic(self, result: int):
+        self.z = result == 0
+        self.n = bool(result & 0x80000000)
+
+    def set_add(self, a: int, b: int, result: int):
+        self.set_logic(result & MASK32)
+        self.c = result > MASK32
+        self.v = (~(a ^ b) & (a ^ result) & 0x80000000) != 0
+
+    def set_sub(self, a: int, b: int, result: int):
+        self.set_logic(result & MASK32)
+        self.c = b > a
+        self.v = ((a ^ b) & (a ^ result) & 0x80000000) != 0
+
+@dataclass
+class RegionStats:
+    instructions: int = 0
+    cycles: int = 0
+
+# instructions ending a basic block
+BLOCK_END = ("B", "CALLR", "RTH", "RTI", "SWITCH")
+
+@dataclass
+class Block:
+    start: int
+    end: int # address after the last instruction
+    body: list[Callable[[], None]]
+    instructions: int
+    cycles: int # base cycles of all instructions including the last
+    last: Encoder # branch ending the block, None if it falls through
+    stats: RegionStats
+    loop: bool # ends with an unconditional BR to its own start
+
+@dataclass
+class Simulator:
+    program: dict[int, Encoder]
+    labels: dict[str, int]
+    memory: bytearray
+    registers: dict[RegUnits, list[int]] = field(default_factory=dict)
+    flags: Flags = field(default_factory=Flags)
+    pc: int = 0
+    end: int = 0
+    instructions: int = 0
+    cycles: int = 0
+    regions: dict[str, RegionStats] = field(default_factory=dict)
+    translate: bool = True
+    blocks: dict[int, Block] = field(default_factory=dict)
+    code_base: int = None # address of the program in memory, if it is there
+    code_written: bool = False
+
+    @classmethod
+    def from_assembler(cls, asm, memory_size: int = 0x10000, code_base: int = None):
+        program = {instruction.address: instruction for instruction in asm.instructions}
+        sim = cls(program, dict(asm.labels), bytearray(memory_size), code_base=code_base)
+        sim.end = max((i.address + i.size for i in asm.instructions), default=0)
+        for unit, size in ((RegUnits.Control, 32), (RegUnits.Data0, 32), (RegUnits.Data1, 32), (RegUnits.Address0, 16), (RegUnits.Address1, 16), (RegUnits.PC, 2)):
+            sim.registers[unit] = [0] * size
+        if code_base is not None:
+            sim.memory[code_base:code_base + len(asm.encoded)] = asm.encoded
+        sim.build_regions()
+        return sim
+
+    def build_regions(self):
+        # every instruction belongs to the closest label before it
+        named = sorted((address, label) for label, address in self.labels.items())
+        self.region_addresses = [address for address, _ in named]
+        self.region_names = [label for _, label in named]
+        self.region_of = {address: self.region(address) for address in self.program}
+
+    def region(self, address: int) -> str:
+        index = bisect.bisect_right(self.region_addresses, address) - 1
+        return self.region_names[index] if index >= 0 else "<start>"
+
+    # registers
+
+    def read(self, register: Register) -> int:
+        if register.unit == RegUnits.PC:
+            return self.pc
+        return self.registers[register.unit][register.number]
+
+    def write(self, register: Register, value: int):
+        if register.unit == RegUnits.PC:
+            self.pc = value & MASK32
+            return
+        self.registers[register.unit][register.number] = value & MASK32
+
+    def value(self, arg: Argument) -> int:
+        if arg.type == ArgumentType.Register:
+            return self.read(arg.register)
+        return arg.constant & MASK32
+
+    def control(self, number: int) -> int:
+        return self.registers[RegUnits.Control][number]
+
+    def duarith_mode(self) -> int:
+        return self.control(TXMODE) & 3
+
+    def address_mode(self, unit: RegUnits) -> int:
+        shift = 8 if unit == RegUnits.Address0 else 12
+        return (self.control(TXMODE) >> shift) & 7
+
+    def address_add(self, unit: RegUnits, address: int, increment: int) -> int:
+        mode = self.address_mode(unit)
+        if mode == ADDRMODE_MODULO and self.control(TXMRSIZE):
+            # wrap inside the aligned buffer of TXMRSIZE bytes
+            size = self.control(TXMRSIZE)
+            return (address & ~(size - 1)) | ((address + increment) & (size - 1))
+        if mode == ADDRMODE_BITREV:
+            return bitrev_add(address, increment) & MASK32
+        return (address + increment) & MASK32
+
+    # memory
+
+    def load(self, address: int, size: int) -> int:
+        if address + size > len(self.memory):
+            logger.critical("Load of %d bytes at 0x%x outside of memory at pc 0x%x", size, address, self.pc)
+            exit()
+        return int.from_bytes(self.memory[address:address + size], "little")
+
+    def store(self, address: int, size: int, value: int):
+        if address + size > len(self.memory):
+            logger.critical("Store of %d bytes at 0x%x outside of memory at pc 0x%x", size, address, self.pc)
+            exit()
+        self.memory[address:address + size] = (value & ((1 << size * 8) - 1)).to_bytes(size, "little")
+        if self.code_base is not None and address < self.code_base + self.end and address + size > self.code_base:
+            self.invalidate(address - self.code_base, size)
+
+    def invalidate(self, offset: int, size: int):
+        """Drop translations of modified code and decode it again from memory"""
+        for start in [start for start, block in self.blocks.items() if start < offset + size and block.end > offset]:
+            del self.blocks[start]
+        for address in [a for a, i in self.program.items() if a < offset + size and a + i.size > offset]:
+            del self.program[address]
+            base = self.code_base + address
+            halfword = int.from_bytes(self.memory[base:base + 2], "little")
+            word_size = instruction_size(halfword)
+            decoded = decode(int.from_bytes(self.memory[base:base + word_size], "little"), word_size)
+            if decoded is None:
+                # fails once executed
+                continue
+            op, args = decoded
+            instruction = Encoder(address, op)
+            instruction.parse_args(list(args))
+            instruction.encode()
+            self.program[address] = instruction
+            self.region_of[address] = self.region(address)
+        self.code_written = True
+
+    def memory_access(self, arg: Argument, transfer_size: int) -> int:
+        """Address of a memory argument, applying the post increment"""
+        base = arg.register
+        address = self.read(base)
+        if arg.offset.type == ArgumentType.Register:
+            offset = self.read(arg.offset.register)
+        else:
+            offset = arg.offset.constant
+            if arg.post_increment and offset in (1, -1):
+                offset *= 1 << transfer_size
+        if arg.post_increment:
+            self.write(base, self.address_add(base.unit, address, offset))
+            return address
+        return (address + offset) & MASK32
+
+    # execution
+
+    def run(self, entry: int = 0, max_steps: int = 100_000_000):
+        if self.translate:
+            self.run_blocks(entry, max_steps)
+            return
+        self.pc = entry
+        steps = 0
+        while self.pc != self.end:
+            instruction = self.program.get(self.pc)
+            if instruction is None:
+                logger.critical("No instruction at 0x%x", self.pc)
+                exit()
+            if not self.step(instruction):
+                break
+            steps += 1
+            if steps >= max_steps:
+                logger.critical("Stopped after %d instructions", steps)
+                exit()
+
+    def run_blocks(self, entry: int, max_steps: int):
+        self.pc = entry
+        control = self.registers[RegUnits.Control]
+        while self.pc != self.end:
+            block = self.blocks.get(self.pc)
+            if block is None:
+                block = self.translate_block(self.pc)
+            self.code_written = False
+            iterations = 1
+            body = block.body
+            if block.loop:
+                # hardware loop, run all iterations without leaving python
+                iterations = control[TXRPT] + 1
+                for i in range(iterations):
+                    for operation in body:
+                        operation()
+                    if self.code_written:
+                        # continue with the new code after this iteration
+                        iterations = i + 1
+                        break
+                # the branches of all but the last iteration were taken
+                control[TXRPT] -= iterations - 1
+            else:
+                for operation in body:
+                    operation()
+            cycles = iterations * block.cycles + (iterations - 1) * TAKEN_REPEAT_CYCLES
+            last = block.last
+            if last is None:
+                self.pc = block.end
+            else:
+                self.pc = last.address
+                result = getattr(self, f"op_{last.instruction.name}")(last)
+                if result is False:
+                    # the halting instruction isn't counted
+                    self.count(block, iterations, cycles - CYCLES.get(last.instruction.name, 1), -1)
+                    break
+                if result is None:
+                    self.pc = block.end
+                else:
+                    cycles += result
+            self.count(block, iterations, cycles)
+            if self.instructions >= max_steps:
+                logger.critical("Stopped after %d instructions", self.instructions)
+                exit()
+
+    def count(self, block: Block, iterations: int, cycles: int, adjust: int = 0):
+        instructions = iterations * block.instructions + adjust
+        self.instructions += instructions
+        self.cycles += cycles
+        block.stats.instructions += instructions
+        block.stats.cycles += cycles
+
+    def translate_block(self, start: int) -> Block:
+        body = []
+        cycles = 0
+        count = 0
+        address = start
+        last = None
+        region = self.region_of.get(start)
+        while address != self.end:
+            instruction = self.program.get(address)
+            if instruction is None:
+                if count == 0:
+                    logger.critical("No instruction at 0x%x", address)
+                    exit()
+                break
+            if count and self.region_of[address] != region:
+                # labels start new blocks so counts stay per region
+                break
+            name = instruction.instruction.name
+            if not hasattr(self, f"op_{name}"):
+                logger.critical("Instruction %s is not supported by the simulator", name)
+                exit()
+            cycles += CYCLES.get(name, 1)
+            count += 1
+            address += instruction.size
+            if name in BLOCK_END:
+                last = instruction
+                break
+            body.append(self.translate_instruction(instruction))
+        loop = (
+            last is not None and last.instruction.name == "B" and last.modifiers == ["R"]
+            and last.address + last.args[0].constant == start
+            and not any(self.writes_control(self.program[a]) for a in self.block_addresses(start, last.address))
+            )
+        block = Block(start, address, body, count, cycles, last, self.regions.setdefault(region, RegionStats()), loop)
+        self.blocks[start] = block
+        return block
+
+    def block_addresses(self, start: int, end: int) -> list[int]:
+        return [address for address in self.program if start <= address < end]
+
+    def writes_control(self, instruction: Encoder) -> bool:
+        return any(arg.type == ArgumentType.Register and arg.register.unit == RegUnits.Control for arg in instruction.args)
+
+    def translate_instruction(self, instruction: Encoder) -> Callable[[], None]:
+        """Closure executing the instruction, specialized for frequent ones"""
+        name = instruction.instruction.name
+        if name in ("GET", "GETD", "SET", "SETD") and all(
+                arg.register.unit not in (RegUnits.Control, RegUnits.PC) for arg in instruction.args):
+            return self.translate_memory(instruction, name.startswith("GET"))
+        handler = getattr(self, f"op_{name}")
+        if any(arg.type == ArgumentType.Register and arg.register.unit == RegUnits.PC for arg in instruction.args):
+            # reads the pc, which is otherwise only set per block
+            def with_pc():
+                self.pc = instruction.address
+                handler(instruction)
+            return with_pc
+        return partial(handler, instruction)
+
+    def translate_memory(self, instruction: Encoder, load: bool) -> Callable[[], None]:
+        transfer_size = self.transfer(instruction, instruction.instruction.name)
+        registers, memory = self.memory_registers(instruction)
+        size = 1 << transfer_size
+        words = [(self.registers[r.unit], r.number, 4 * i) for i, r in enumerate(registers)]
+        if transfer_size != TRANSFER_MAP["L"]:
+            words = words[:1]
+            word_size = size
+        else:
+            word_size = 4
+        base_unit = memory.register.unit
+        base = self.registers[base_unit]
+        base_number = memory.register.number
+        post_increment = memory.post_increment
+        offset_registers = offset_number = None
+        offset = 0
+        if memory.offset.type == ArgumentType.Register:
+            offset_registers = self.registers[memory.offset.register.unit]
+            offset_number = memory.offset.register.number
+        else:
+            offset = memory.offset.constant
+            if post_increment and offset in (1, -1):
+                offset *= size
+        mem = self.memory
+        address_add = self.address_add
+        load_address = self.load
+        store = self.store
+
+        control = self.registers[RegUnits.Control]
+        mode_shift = 8 if base_unit == RegUnits.Address0 else 12
+
+        def access() -> int:
+            address = base[base_number]
+            increment = offset if offset_registers is None else offset_registers[offset_number]
+            if post_increment:
+                if (control[TXMODE] >> mode_shift) & 7:
+                    base[base_number] = address_add(base_unit, address, increment)
+                else:
+                    # linear addressing, by far the most common
+                    base[base_number] = (address + increment) & MASK32
+                return address
+            return (address + increment) & MASK32
+
+        if load:
+            def get():
+                address = access()
+                if address + size > len(mem):
+                    load_address(address, size)
+                for registers, number, position in words:
+                    registers[number] = int.from_bytes(mem[address + position:address + position + word_size], "little")
+            return get
+
+        if self.code_base is not None or len(words) > 1:
+            def set():
+                values = [registers[number] for registers, number, _ in words]
+                address = access()
+                for value, (_, _, position) in zip(values, words):
+                    store(address + position, word_size, value)
+            return set
+
+        (registers, number, _), = words
+        value_mask = (1 << word_size * 8) - 1
+        def set_word():
+            value = registers[number]
+            address = access()
+            if address + word_size > len(mem):
+                store(address, word_size, value)
+            mem[address:address + word_size] = (value & value_mask).to_bytes(word_size, "little")
+        return set_word
+
+    def step(self, instruction: Encoder) -> bool:
+        """Execute one instruction, returns False if execution halts"""
+        name = instruction.instruction.name
+        handler = getattr(self, f"op_{name}", None)
+        if handler is None:
+            logger.critical("Instruction %s is not supported by the simulator", name)
+            exit()
+        next_pc = instruction.address + instruction.size
+        self.pc = instruction.address
+        cycles = CYCLES.get(name, 1)
+        result = handler(instruction)
+        if result is False:
+            return False
+        if result is None:
+            self.pc = next_pc
+        else:
+            # taken branch, the handler returns the branch penalty
+            cycles += result
+        self.instructions += 1
+        self.cycles += cycles
+        stats = self.regions.setdefault(self.region_of[instruction.address], RegionStats())
+        stats.instructions += 1
+        stats.cycles += cycles
+        return True
+
+    def dual(self, instruction: Encoder) -> bool:
+        return self.duarith_mode() != 0 and (
+            "P" in instruction.modifiers or instruction.instruction.name.startswith("DSP"))
+
+    def data_units(self, instruction: Encoder, register: Register) -> list[RegUnits]:
+        # DSP instructions work on the same registers in both data units
+        if self.dual(instruction) and register.unit in (RegUnits.Data0, RegUnits.Data1):
+            return [RegUnits.Data0, RegUnits.Data1]
+        return [register.unit]
+
+    def immediate(self, instruction: Encoder, arg: Argument) -> int:
+        value = arg.constant
+        modifiers = instruction.modifiers
+        if "M" in modifiers:
+            # mask, the other half is all ones
+            if "T" in modifiers:
+                return (value & 0xffff) << 16 | 0xffff
+            return 0xffff0000 | (value & 0xffff)
+        if "T" in modifiers:
+            return (value & 0xffff) << 16
+        if self.dual(instruction) and self.duarith_mode() == DUARITH_SPLIT16:
+            # same immediate for both halves
+            return (value & 0xffff) << 16 | (value & 0xffff)
+        return value & MASK32
+
+    def alu(self, instruction: Encoder, op, split_op=None, flags=None):
+        """Execute dest = op(src1, src2) or dest = op(dest, src) with the DSP rules"""
+        args = instruction.args
+        dest = args[0].register
+        for unit in self.data_units(instruction, dest):
+            def operand(arg: Argument) -> int:
+                if arg.type == ArgumentType.Constant:
+                    return self.immediate(instruction, arg)
+                register = arg.register
+                if unit != dest.unit and register.unit in (RegUnits.Data0, RegUnits.Data1):
+                    register = Register(unit, register.number)
+                return self.read(register)
+            operands = [operand(arg) for arg in args[1:]]
+            if len(operands) == 1:
+                operands.insert(0, self.read(Register(unit, dest.number)))
+            a, b = operands
+            if split_op is not None and self.dual(instruction) and self.duarith_mode() == DUARITH_SPLIT16:
+                result = split_op(a, b)
+            else:
+                result = op(a, b)
+            if "S" in instruction.modifiers and flags is not None:
+                flags(a, b, result)
+            self.write(Register(unit, dest.number), result)
+
+    def address_arith(self, instruction: Encoder, sign: int) -> bool:
+        dest = instruction.args[0].register
+        if dest.unit not in (RegUnits.Address0, RegUnits.Address1) or len(instruction.args) != 3:
+            return False
+        a = self.value(instruction.args[1])
+        b = self.immediate(instruction, instruction.args[2]) if instruction.args[2].type == ArgumentType.Constant else self.value(instruction.args[2])
+        self.write(dest, self.address_add(dest.unit, a, sign * b))
+        return True
+
+    def op_ADD(self, instruction: Encoder):
+        if self.address_arith(instruction, 1):
+            return
+        self.alu(instruction, lambda a, b: a + b, flags=self.flags.set_add)
+
+    def op_SUB(self, instruction: Encoder):
+        if self.address_arith(instruction, -1):
+            return
+        self.alu(instruction, lambda a, b: a - b, flags=self.flags.set_sub)
+
+    def op_AND(self, instruction: Encoder):
+        self.alu(instruction, lambda a, b: a & b, lambda a, b: a & b, flags=lambda a, b, r: self.flags.set_logic(r))
+
+    def op_OR(self, instruction: Encoder):
+        self.alu(instruction, lambda a, b: a | b, lambda a, b: a | b, flags=lambda a, b, r: self.flags.set_logic(r))
+
+    def op_XOR(self, instruction: Encoder):
+        self.alu(instruction, lambda a, b: a ^ b, lambda a, b: a ^ b, flags=lambda a, b, r: self.flags.set_logic(r))
+
+    def op_LSL(self, instruction: Encoder):
+        self.alu(instruction, lambda a, b: a << (b & 31), lambda a, b: split16(a, lambda h: h << (b & 15)), flags=lambda a, b, r: self.flags.set_logic(r & MASK32))
+
+    def op_LSR(self, instruction: Encoder):
+        self.alu(instruction, lambda a, b: a >> (b & 31), lambda a, b: split16(a, lambda h: h >> (b & 15)), flags=lambda a, b, r: self.flags.set_logic(r))
+
+    def op_ASL(self, instruction: Encoder):
+        self.op_LSL(instruction)
+
+    def op_ASR(self, instruction: Encoder):
+        self.alu(instruction, lambda a, b: signed(a) >> (b & 31), lambda a, b: split16(a, lambda h: signed16(h) >> (b & 15)), flags=lambda a, b, r: self.flags.set_logic(r & MASK32))
+
+    def op_MUL(self, instruction: Encoder):
+        if "D" in instruction.modifiers:
+            self.alu(instruction, lambda a, b: a * b)
+        else:
+            self.alu(instruction, lambda a, b: (a & 0xffff) * (b & 0xffff))
+
+    def op_DSPMUL(self, instruction: Encoder):
+        def split(a: int, b: int) -> int:
+            if "C" in instruction.modifiers:
+                ar, ai, br, bi = a >> 16, a & 0xffff, b >> 16, b & 0xffff
+                real = mul_fixed(ar, br) - mul_fixed(ai, bi)
+                imag = mul_fixed(ar, bi) + mul_fixed(ai, br)
+                return (real & 0xffff) << 16 | (imag & 0xffff)
+            return (mul_fixed(a >> 16, b >> 16) & 0xffff) << 16 | (mul_fixed(a & 0xffff, b & 0xffff) & 0xffff)
+        self.alu(instruction, lambda a, b: a * b, split)
+
+    def op_DSPMUL8(self, instruction: Encoder):
+        # modelled from the modifiers only: multiply one byte of every half
+        def multiply(a: int, b: int) -> int:
+            if "X" in instruction.modifiers:
+                a >>= 8
+            a, b = a & 0xff, b & 0xff
+            if "U" not in instruction.modifiers:
+                a = a - 0x100 if a & 0x80 else a
+                b = b - 0x100 if b & 0x80 else b
+            return a * b
+        halves = lambda a, b: (multiply(a >> 16, b >> 16) & 0xffff) << 16 | (multiply(a, b) & 0xffff)
+        self.alu(instruction, halves, halves)
+
+    def op_NEG(self, instruction: Encoder):
+        self.alu(instruction, lambda a, b: -b, flags=self.flags.set_sub)
+
+    def op_ABS(self, instruction: Encoder):
+        self.alu(instruction, lambda a, b: abs(signed(b)))
+
+    def op_MAX(self, instruction: Encoder):
+        self.alu(instruction, lambda a, b: max(signed(a), signed(b)))
+
+    def op_MIN(self, instruction: Encoder):
+        self.alu(instruction, lambda a, b: min(signed(a), signed(b)))
+
+    def op_FFB(self, instruction: Encoder):
+        # index of the first bit differing from the sign bit, -1 if none
+        self.alu(instruction, lambda a, b: ((b ^ MASK32) if b & 0x80000000 else b).bit_length() - 1)
+
+    def op_NORM(self, instruction: Encoder):
+        # number of redundant sign bits
+        self.alu(instruction, lambda a, b: 31 - ((b ^ MASK32) if b & 0x80000000 else b).bit_length() if b not in (0, MASK32) else 0)
+
+    def op_CMP(self, instruction: Encoder):
+        a = self.value(instruction.args[0])
+        arg = instruction.args[1]
+        b = self.immediate(instruction, arg) if arg.type == ArgumentType.Constant else self.value(arg)
+        self.flags.set_sub(a, b, a - b)
+
+    def op_TST(self, instruction: Encoder):
+        a = self.value(instruction.args[0])
+        arg = instruction.args[1]
+        b = self.immediate(instruction, arg) if arg.type == ArgumentType.Constant else self.value(arg)
+        self.flags.set_logic(a & b)
+
+    def op_MOV(self, instruction: Encoder):
+        dest, src = instruction.args
+        if src.type == ArgumentType.Constant:
+            value = self.immediate(instruction, src)
+        else:
+            value = self.read(src.register)
+        self.write(dest.register, value)
+        if "S" in instruction.modifiers:
+            self.flags.set_logic(value)
+
+    def op_SWAP(self, instruction: Encoder):
+        a, b = instruction.args
+        value = self.read(a.register)
+        self.write(a.register, self.read(b.register))
+        self.write(b.register, value)
+
+    def op_NOP(self, instruction: Encoder):
+        pass
+
+    def op_RTH(self, instruction: Encoder):
+        return False
+
+    def op_RTI(self, instruction: Encoder):
+        return False
+
+    def op_SWITCH(self, instruction: Encoder):
+        return False
+
+    def branch(self, instruction: Encoder, displacement: int):
+        condition = 0
+        for modifier in instruction.modifiers:
+            if modifier in CONDITION_MAP:
+                condition = CONDITION_MAP[modifier]
+        if not condition_holds(condition, self.flags):
+            return None
+        if "R" in instruction.modifiers:
+            # hardware loop
+            count = self.control(TXRPT)
+            if count == 0:
+                return None
+            self.registers[RegUnits.Control][TXRPT] = count - 1
+            self.pc = instruction.address + displacement
+            return TAKEN_REPEAT_CYCLES
+        self.pc = instruction.address + displacement
+        return TAKEN_BRANCH_CYCLES
+
+    def op_B(self, instruction: Encoder):
+        return self.branch(instruction, instruction.args[0].constant)
+
+    def op_CALLR(self, instruction: Encoder):
+        link, target = instruction.args
+        self.write(link.register, instruction.address + instruction.size)
+        return self.branch(instruction, target.constant)
+
+    def transfer(self, instruction: Encoder, name: str) -> int:
+        if name in ("GETD", "SETD"):
+            return TRANSFER_MAP["D"]
+        for modifier in instruction.modifiers:
+            if modifier in TRANSFER_MAP:
+                return TRANSFER_MAP[modifier]
+        return TRANSFER_MAP["D"]
+
+    def memory_registers(self, instruction: Encoder) -> tuple[list[Register], Argument]:
+        # encoding order, the first register is at the lower address
+        args = instruction.args[::-1] if instruction.instruction.swap_args else instruction.args
+        *registers, memory = args
+        registers = [arg.register for arg in registers]
+        if self.transfer(instruction, instruction.instruction.name) == TRANSFER_MAP["L"] and len(registers) == 1:
+            # 64 bit transfers always use a register pair
+            other = {RegUnits.Data0: RegUnits.Data1, RegUnits.Data1: RegUnits.Data0, RegUnits.Address0: RegUnits.Address1, RegUnits.Address1: RegUnits.Address0}
+            registers.append(Register(other[registers[0].unit], registers[0].number))
+        return registers, memory
+
+    def op_GET(self, instruction: Encoder):
+        transfer_size = self.transfer(instruction, instruction.instruction.name)
+        registers, memory = self.memory_registers(instruction)
+        address = self.memory_access(memory, transfer_size)
+        if transfer_size == TRANSFER_MAP["L"]:
+            for i, register in enumerate(registers):
+                self.write(register, self.load(address + 4 * i, 4))
+        else:
+            self.write(registers[0], self.load(address, 1 << transfer_size))
+
+    def op_SET(self, instruction: Encoder):
+        transfer_size = self.transfer(instruction, instruction.instruction.name)
+        registers, memory = self.memory_registers(instruction)
+        values = [self.read(register) for register in registers]
+        address = self.memory_access(memory, transfer_size)
+        if transfer_size == TRANSFER_MAP["L"]:
+            for i, value in enumerate(values):
+                self.store(address + 4 * i, 4, value)
+        else:
+            self.store(address, 1 << transfer_size, values[0])
+
+    op_GETD = op_GET
+    op_SETD = op_SET
+
+    def report(self) -> dict:
+        return {
+            "instructions": self.instructions,
+            "cycles": self.cycles,
+            "regions": {
+                name: {"instructions": stats.instructions, "cycles": stats.cycles}
+                for name, stats in self.regions.items()
+                },
+            }
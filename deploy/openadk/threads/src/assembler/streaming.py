@@ -0,0 +1,87 @@
+import logging
+import time
+from typing import Iterable, BinaryIO
+from . import Assembler, PACK_FORMATS, profile
+from .encoder import Encoder
+
+logger = logging.getLogger(__name__)
+
+class StreamingAssembler(Assembler):
+    """Assembler writing each instruction to the output as soon as it is encoded.
+
+    Instead of keeping every line until the end only instructions referencing
+    a label that is not defined yet are kept. They reserve 4 bytes and are
+    patched into the output once the label is seen, so the output must be
+    seekable. Addresses can't change after writing, so unlike the normal
+    assembler there is no branch relaxation and every instruction with a
+    label takes 4 bytes.
+    """
+    output: BinaryIO
+    start: int
+    fixups: dict[str, list[Encoder]]
+
+    def __init__(self, output: BinaryIO):
+        self.output = output
+
+    def align(self):
+        assert self.cursor & 1 == 0
+        # addresses are final, emit the padding right away
+        if self.cursor & 2 != 0:
+            self.process_line("NOP")
+
+    def write_instruction(self, instruction: Encoder):
+        self.output.write(PACK_FORMATS[instruction.size].pack(instruction.encoded))
+
+    def write_label_instruction(self, instruction: Encoder):
+        self.write_instruction(instruction)
+        if instruction.size == 2:
+            # pad with nop
+            filler = Encoder(instruction.address + 2, "NOP")
+            filler.encode()
+            self.write_instruction(filler)
+
+    def add_instruction(self, encoder: Encoder):
+        if encoder.label is None:
+            encoder.encode()
+            self.write_instruction(encoder)
+            self.cursor += encoder.size
+            return
+
+        name = encoder.args[encoder.label].name
+        if name in self.labels:
+            # backward reference, can be resolved right away
+            encoder.resolve_label(self.labels)
+            encoder.encode()
+            self.write_label_instruction(encoder)
+        else:
+            # forward reference, reserve 4 bytes until the label is defined
+            self.fixups.setdefault(name, []).append(encoder)
+            self.output.write(bytes(4))
+        self.cursor += 4
+
+    def process_label(self, label: str):
+        super().process_label(label)
+        fixups = self.fixups.pop(label, None)
+        if fixups is None:
+            return
+        for instruction in fixups:
+            instruction.resolve_label(self.labels)
+            instruction.encode()
+            self.output.seek(self.start + instruction.address)
+            self.write_label_instruction(instruction)
+        self.output.seek(self.start + self.cursor)
+
+    def assemble(self, lines: Iterable[str] | str):
+        if isinstance(lines, str):
+            lines = lines.splitlines()
+        self.reset()
+        self.fixups = {}
+        self.start = self.output.tell()
+        start = time.perf_counter() if profile.ENABLED else 0
+        for line in lines:
+            self.process_line(line)
+        if profile.ENABLED:
+            profile.STATS.phase("lines", start)
+        for label in self.fixups:
+            logger.critical("Label %s is not defined", label)
+            exit()
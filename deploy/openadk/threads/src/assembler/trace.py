@@ -0,0 +1,36 @@
+import json
+import logging
+from typing import TextIO
+
+# Opt-in tracing of the assembler internals.
+#
+# Hot paths guard every call with "if trace.ENABLED:", so with tracing
+# disabled neither the call nor the formatting of its arguments happens.
+# When enabled, events are logged at debug level and, if an output is given,
+# also written as one JSON object per line.
+
+ENABLED = False
+output: TextIO = None
+
+def enable(trace_output: TextIO = None):
+    global ENABLED, output
+    ENABLED = True
+    output = trace_output
+
+def disable():
+    global ENABLED, output
+    ENABLED = False
+    if output is not None:
+        output.close()
+    output = None
+
+def record(event: str, **fields):
+    """Write a structured event to the trace output"""
+    if output is not None:
+        output.write(json.dumps({"event": event, **fields}, default=str) + "\n")
+
+def log(logger: logging.Logger, event: str, message: str, *args):
+    """Log a debug message and record it as event"""
+    logger.debug(message, *args)
+    if output is not None:
+        record(event, message=message % args)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from assembler import Assembler
+from assembler.encoder import ENCODING_CACHE
+from assembler.instruction_encodings import Encoding
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+SOURCES = ["encrypt.s", "minim_disable.s"]
+
+# commands timed in fresh interpreters for the startup latency
+STARTUP_COMMANDS = {
+    "import": [sys.executable, "-c", "import assembler"],
+    "minim_disable.s": [sys.executable, "assembler.py", "minim_disable.s", "-o", os.devnull],
+    }
+
+DEFAULT_MIX = {"alu": 0.4, "dsp": 0.2, "memory": 0.25, "branch": 0.15}
+
+def reg(rng: random.Random, limit: int = 8) -> int:
+    return rng.randrange(limit)
+
+# instructions with an immediate need the same register as destination and source
+
+def gen_alu(rng: random.Random) -> str:
+    u = rng.randrange(2)
+    r = reg(rng)
+    match rng.randrange(6):
+        case 0:
+            return f"ADD D{u}.{r}, D{u}.{reg(rng)}, D{u}.{reg(rng)}"
+        case 1:
+            return f"ADD D{u}.{r}, D{u}.{r}, #{rng.randrange(-0x8000, 0x10000)}"
+        case 2:
+            return f"AND D{u}.{r}, D{u}.{r}, #0x{rng.randrange(0x10000):x}"
+        case 3:
+            return f"LSL D{u}.{r}, D{u}.{r}, #{rng.randrange(32)}"
+        case 4:
+            return f"SUBS D{u}.{r}, D{u}.{r}, #{rng.randrange(32)}"
+        case _:
+            r = reg(rng, 4)
+            return f"ADD A{u}.{r}, A{u}.{r}, #0x{rng.randrange(0x10000):x}"
+
+def gen_dsp(rng: random.Random) -> str:
+    r = reg(rng)
+    match rng.randrange(5):
+        case 0:
+            return f"DSPMULD D0.{reg(rng)}, D0.{reg(rng)}, D0.{reg(rng)}"
+        case 1:
+            return f"DSPMULDC D0.{reg(rng)}, D0.{reg(rng)}, D0.{reg(rng)}"
+        case 2:
+            return f"LSLDP D0.{r}, D0.{r}, #8"
+        case 3:
+            return f"ANDDP D0.{r}, D0.{r}, #0xff00"
+        case _:
+            return f"ORDP D0.{reg(rng)}, D0.{reg(rng)}, D0.{reg(rng)}"
+
+def gen_memory(rng: random.Random) -> str:
+    r = reg(rng)
+    match rng.randrange(5):
+        case 0:
+            return f"GETL D1.{r}, D0.{r}, [A0.{reg(rng)}++]"
+        case 1:
+            return f"SETL [A0.{reg(rng)}++], D0.{r}, D1.{r}"
+        case 2:
+            return f"GETB D0.{r}, [A0.{reg(rng)}++]"
+        case 3:
+            return f"SETB [A1.{reg(rng)}+A1.{reg(rng)}++], D0.{r}"
+        case _:
+            return f"GETD D0.{r}, [A0.{reg(rng)}+#{rng.randrange(-32, 32) * 4}]"
+
+def generate(n_lines: int, mix: dict[str, float], seed: int = 0) -> str:
+    """Generate a synthetic MiniM program with the given instruction mix.
+
+    Branches go to labels which are placed every few lines, both backwards
+    to already defined labels and forward to labels defined later.
+    """
+    rng = random.Random(seed)
+    generators = {"alu": gen_alu, "dsp": gen_dsp, "memory": gen_memory}
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    n_labels = max(1, n_lines // 16)
+    label = 0
+    lines = []
+    for i in range(n_lines):
+        if i % 16 == 0 and label < n_labels:
+            lines.append(f"L{label}:")
+            label += 1
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "branch":
+            # mostly nearby targets, sometimes far away ones
+            window = 4 if rng.random() < 0.8 else n_labels
+            target = min(n_labels - 1, max(0, label + rng.randrange(-window, window + 1)))
+            op = rng.choice(["B", "BNZ", "BEQ", "BR"])
+            lines.append(f"{op} L{target}")
+        else:
+            lines.append(generators[kind](rng))
+    while label < n_labels:
+        lines.append(f"L{label}:")
+        label += 1
+    return "\n".join(lines) + "\n"
+
+def assemble_phases(assembly: str) -> tuple[Assembler, dict[str, float]]:
+    ENCODING_CACHE.clear()
+    asm = Assembler()
+    asm.reset()
+    phases = {}
+    start = time.perf_counter()
+    for line in assembly.splitlines():
+        asm.process_line(line)
+    phases["process_line"] = time.perf_counter() - start
+    start = time.perf_counter()
+    asm.fill_labels()
+    phases["fill_labels"] = time.perf_counter() - start
+    start = time.perf_counter()
+    asm.create_encoded()
+    phases["create_encoded"] = time.perf_counter() - start
+    return asm, phases
+
+def bench(name: str, assembly: str, repeat: int) -> dict:
+    n_lines = len(assembly.splitlines())
+    best = None
+    for _ in range(repeat):
+        asm, phases = assemble_phases(assembly)
+        if best is None or sum(phases.values()) < sum(best.values()):
+            best = phases
+    # separate run, tracing allocations slows down everything
+    tracemalloc.start()
+    assemble_phases(assembly)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    total = sum(best.values())
+    return {
+        "name": name,
+        "lines": n_lines,
+        "instructions": len(asm.instructions),
+        "bytes": len(asm.encoded),
+        "phases": best,
+        "total": total,
+        "lines_per_sec": n_lines / total if total else None,
+        "peak_memory": peak,
+        "cache": {"hits": ENCODING_CACHE.hits, "misses": ENCODING_CACHE.misses},
+    }
+
+def startup(repeat: int) -> dict:
+    results = {}
+    for name, command in STARTUP_COMMANDS.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        results[name] = {"min": min(times), "median": statistics.median(times)}
+    return results
+
+def parse_mix(raw: str) -> dict[str, float]:
+    mix = {}
+    for part in raw.split(","):
+        kind, weight = part.split("=")
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown instruction kind {kind}")
+        mix[kind] = float(weight)
+    return mix
+
+def main(args):
+    Encoding.reference = args.reference
+    results = []
+    for source in SOURCES:
+        results.append(bench(source, open(source).read(), args.repeat))
+    for n_lines in args.lines:
+        assembly = generate(n_lines, args.mix, args.seed)
+        results.append(bench(f"synthetic-{n_lines}", assembly, args.repeat))
+
+    report = {
+        "python": platform.python_version(),
+        "reference": args.reference,
+        "mix": args.mix,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.startup:
+        report["startup"] = startup(args.startup)
+        for name, result in report["startup"].items():
+            logger.warning("startup %-12s min=%.1fms median=%.1fms", name, result["min"] * 1000, result["median"] * 1000)
+    for result in results:
+        phases = " ".join(f"{phase}={t * 1000:.1f}ms" for phase, t in result["phases"].items())
+        logger.warning("%-20s %8d lines %10.0f lines/s %s peak=%.1fKiB", result["name"], result["lines"], result["lines_per_sec"] or 0, phases, result["peak_memory"] / 1024)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the assembler on the kernels and synthetic programs")
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("-n", "--lines", type=int, nargs="*", default=[1000, 10000], help="Sizes of the synthetic programs")
+    parser.add_argument("-m", "--mix", type=parse_mix, default=DEFAULT_MIX, help="Instruction mix, e.g. alu=0.4,dsp=0.2,memory=0.25,branch=0.15")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Runs per program, the fastest is reported")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed for the synthetic programs")
+    parser.add_argument("--reference", action="store_true", default=False, help="Use the reference implementation for matching and encoding")
+    parser.add_argument("--startup", type=int, default=0, metavar="N", help="Also time N fresh interpreters importing the assembler and assembling minim_disable.s")
+    args = parser.parse_args()
+    main(args)
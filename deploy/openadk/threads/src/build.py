@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+from assembler import Assembler, ObjectAssembler
+from assembler.cache import AssemblyCache, DEFAULT_MAX_SIZE, cache_key
+from assembler.instruction_encodings import Encoding, gen_all_constraints
+from assembler.instructions import INSTRUCTIONS, lookup_instruction
+from assembler.linker import link
+from assembler.objects import ObjectFile
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Assemble many sources in one invocation.
+#
+# The instruction tables are built and all encodings compiled once in the
+# parent, then the pool is forked so the workers share all of it copy-on-write
+# instead of paying for it per file. With --link the sources are assembled
+# to objects and linked into one image, only changed objects miss the cache.
+
+def preload():
+    gen_all_constraints()
+    # the per op lookups are cached too, warm them for the plain names
+    for instruction in INSTRUCTIONS:
+        lookup_instruction(instruction.name)
+
+def sources(paths: list[str]) -> list[tuple[Path, Path]]:
+    """Source files with their path relative to the given directory"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend((file, file.relative_to(path)) for file in sorted(path.rglob("*.s")))
+        else:
+            files.append((path, Path(path.name)))
+    return files
+
+def output_path(source: Path, relative: Path, directory: str | None, suffix: str) -> Path:
+    if directory is None:
+        return source.with_suffix(suffix)
+    return Path(directory) / relative.with_suffix(suffix)
+
+cache = None
+objects = False
+
+def init_worker(cache_dir: str | None, cache_size: int, reference: bool, object_files: bool):
+    global cache, objects
+    Encoding.reference = reference
+    objects = object_files
+    if cache_dir:
+        cache = AssemblyCache(cache_dir, cache_size)
+
+def assemble(job: tuple[Path, Path]) -> dict:
+    source, output = job
+    start = time.perf_counter()
+    report = {"source": str(source), "output": str(output), "cached": False}
+    try:
+        assembly = source.read_text()
+        encoded = None
+        if cache is not None:
+            options = {"reference": Encoding.reference}
+            if objects:
+                # the object records the name of its source
+                options["object"] = source.name
+            key = cache_key(assembly, options)
+            cached = cache.get(key)
+            if cached is not None:
+                encoded, labels = cached
+                report["cached"] = True
+        if encoded is None:
+            asm = ObjectAssembler() if objects else Assembler()
+            asm.assemble(assembly)
+            encoded = asm.to_object(source.name).dumps() if objects else bytes(asm.encoded)
+            labels = asm.labels
+            report["instructions"] = len(asm.instructions)
+            if cache is not None:
+                cache.put(key, encoded, labels)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_bytes(encoded)
+        report.update(ok=True, bytes=len(encoded), labels=len(labels))
+    except SystemExit:
+        # the assembler already logged the error
+        report["ok"] = False
+    except OSError as e:
+        logger.error("%s: %s", source, e)
+        report["ok"] = False
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+def main(args):
+    files = sources(args.inputs)
+    suffix = ".o" if args.object or args.link else ".bin"
+    jobs = [(source, output_path(source, relative, args.output_dir, suffix)) for source, relative in files]
+    preload()
+    start = time.perf_counter()
+    init_args = (args.cache_dir, args.cache_size, args.reference, args.object or args.link is not None)
+    if args.jobs == 1 or len(jobs) <= 1:
+        init_worker(*init_args)
+        reports = [assemble(job) for job in jobs]
+    else:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(args.jobs, init_worker, init_args) as pool:
+            reports = pool.map(assemble, jobs, chunksize=max(1, len(jobs) // (4 * args.jobs)))
+    failed = [report["source"] for report in reports if not report["ok"]]
+    if args.link and not failed:
+        # in the order of the sources
+        image, _ = link([ObjectFile.load(output) for _, output in jobs])
+        Path(args.link).write_bytes(image)
+    seconds = time.perf_counter() - start
+    summary = {
+        "files": len(reports),
+        "failed": len(failed),
+        "cached": sum(report["cached"] for report in reports),
+        "bytes": sum(report.get("bytes", 0) for report in reports),
+        "jobs": args.jobs,
+        "seconds": seconds,
+        }
+    logger.warning("Assembled %d files, %d failed, %d from cache, %d bytes in %.2f s",
+        summary["files"], summary["failed"], summary["cached"], summary["bytes"], seconds)
+    for source in failed:
+        logger.error("Failed: %s", source)
+    if args.report:
+        with open(args.report, "w") as output:
+            json.dump({"summary": summary, "files": reports}, output, indent=2)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Assemble many sources with a pool of workers sharing the instruction tables")
+    parser.add_argument("inputs", nargs="+", help="Source files or directories searched recursively for .s files")
+    parser.add_argument("-o", "--output-dir", help="Write the images here, the input paths are recreated inside. Default next to the source")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("-c", "--object", action="store_true", default=False, help="Write relocatable objects instead of images")
+    parser.add_argument("--link", metavar="OUTPUT", help="Assemble to objects and link them in the given order into this image")
+    parser.add_argument("--report", help="Write a JSON build report to this file")
+    parser.add_argument("--cache-dir", help="Reuse assembled images from this directory if the source and assembler are unchanged")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_SIZE, help="Maximum size of the cache directory in bytes")
+    parser.add_argument("--reference", action="store_true", default=False, help="Match and encode with the generic reference implementation instead of the compiled functions")
+    args = parser.parse_args()
+    main(args)
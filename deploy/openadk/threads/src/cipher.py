@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import argparse
+import base64
+import logging
+import sys
+import numpy as np
+from simulate import N_WORDS, N_BYTES, N_INPUT_BYTES, DST, load_key
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Reference model of encrypt.s working on whole blocks with numpy.
+#
+# Blocks are arrays of N_WORDS little endian words, a batch is an array of
+# shape (n, N_WORDS). The kernel does:
+#  1. cmul_loop: every word holds two complex numbers of bytes, real parts in
+#     bytes 3 and 2, imaginary parts in bytes 1 and 0. Each is multiplied with
+#     the same number of the key word modulo 256.
+#  2. cswap_loop: byte k of dst goes to src[bitreverse12(k)]. A1.2 walks the
+#     bit reversed addresses inside the 4k aligned buffer.
+#  3. ROUNDS times: dst = src * key modulo 2**32, then the byte shuffle again.
+#     The ADD before each shuffle advances A1.2 one bit reversed step, so in
+#     round r byte k goes to src[bitreverse12(r + 1 + k)].
+# The ciphertext is dst after the last multiplication, the last shuffle only
+# writes src.
+
+ROUNDS = 20
+ADDRESS_BITS = 12
+
+def bitreverse(values: np.ndarray, bits: int) -> np.ndarray:
+    result = np.zeros_like(values)
+    for bit in range(bits):
+        result |= ((values >> bit) & 1) << (bits - 1 - bit)
+    return result
+
+# source of every byte in the shuffle of each round, the bit reversed walk
+# is inverted once so the shuffle is a gather instead of a scatter
+SHUFFLES = [
+    np.argsort(bitreverse((start + np.arange(N_BYTES)) % N_BYTES, ADDRESS_BITS))
+    for start in range(ROUNDS + 1)
+    ]
+
+def as_blocks(blocks) -> np.ndarray:
+    return np.ascontiguousarray(blocks, dtype="<u4").reshape(-1, N_WORDS)
+
+def complex_multiply(blocks: np.ndarray, key: np.ndarray) -> np.ndarray:
+    data = blocks.view(np.uint8).reshape(-1, N_WORDS, 4).astype(np.uint16)
+    key = key.view(np.uint8).reshape(N_WORDS, 4).astype(np.uint16)
+    real, imag = data[..., 2:], data[..., :2]
+    key_real, key_imag = key[:, 2:], key[:, :2]
+    result = np.empty_like(data)
+    # 16 bit wrap around keeps the low byte exact
+    result[..., 2:] = real * key_real - imag * key_imag
+    result[..., :2] = real * key_imag + imag * key_real
+    return result.astype(np.uint8).view("<u4").reshape(blocks.shape)
+
+def shuffle(blocks: np.ndarray, start: int) -> np.ndarray:
+    return np.take(blocks.view(np.uint8), SHUFFLES[start], axis=1).view("<u4")
+
+def encrypt(blocks, key) -> np.ndarray:
+    """Encrypt a batch of src blocks like the kernel, returns the dst blocks"""
+    blocks = as_blocks(blocks)
+    key = np.asarray(key, dtype="<u4")
+    src = shuffle(complex_multiply(blocks, key), 0)
+    for i in range(ROUNDS):
+        dst = src * key
+        if i + 1 < ROUNDS:
+            src = shuffle(dst, i + 1)
+    return dst
+
+def encode(data: bytes) -> np.ndarray:
+    """Split a file into src blocks like main.c: base64 chunks in zeroed blocks"""
+    count = -(-len(data) // N_INPUT_BYTES)
+    blocks = np.zeros((count, N_BYTES), dtype=np.uint8)
+    for i in range(count):
+        encoded = base64.b64encode(data[i * N_INPUT_BYTES:(i + 1) * N_INPUT_BYTES])
+        blocks[i, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+    return blocks.view("<u4")
+
+def check(source: str, data: bytes, key: list[int], count: int) -> bool:
+    """Compare the first blocks with the simulated kernel"""
+    from simulate import simulate
+    expected = encrypt(encode(data[:count * N_INPUT_BYTES]), key)
+    for i in range(len(expected)):
+        sim = simulate(source, data[i * N_INPUT_BYTES:(i + 1) * N_INPUT_BYTES], key)
+        if sim.memory[DST:DST + N_BYTES] != expected[i].tobytes():
+            logger.error("Block %d differs from the simulator", i)
+            return False
+    logger.warning("%d blocks match the simulator", len(expected))
+    return True
+
+def main(args):
+    data = open(args.input, "rb").read()
+    key = load_key(args.key)
+    if args.check:
+        if not check(args.source, data, key, args.check):
+            sys.exit(1)
+    if args.output:
+        with open(args.output, "wb") as output:
+            output.write(encrypt(encode(data), key).tobytes())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Encrypt a file like the kernel running on the device")
+    parser.add_argument("input", help="Plain text file")
+    parser.add_argument("-o", "--output", help="Encrypted file")
+    parser.add_argument("-k", "--key", default="enc_key.h", help="Key header")
+    parser.add_argument("-c", "--check", type=int, default=0, metavar="N", help="Compare the first N blocks with the simulator")
+    parser.add_argument("--source", default="encrypt.s", help="Kernel source for --check")
+    args = parser.parse_args()
+    main(args)
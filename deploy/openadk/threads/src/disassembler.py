@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import sys
+from assembler import Assembler
+from assembler.disassembler import disassemble, disassemble_source
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+def roundtrip(data: bytes, address: int) -> bool:
+    """Disassemble and assemble again, the result must be identical"""
+    instructions = list(disassemble(data, address))
+    unknown = [instruction for instruction in instructions if instruction.op is None]
+    for instruction in unknown:
+        logger.error("Can't decode 0x%x at 0x%x", instruction.encoded, instruction.address)
+    asm = Assembler()
+    asm.assemble(disassemble_source(data, address))
+    if bytes(asm.encoded) != bytes(data):
+        for old, new in zip(instructions, asm.instructions):
+            if old.encoded != new.encoded or old.size != new.size:
+                logger.error("Mismatch at 0x%x: %s reassembled to %s", old.address, old.text(), new)
+                break
+        else:
+            logger.error("Size mismatch: %d bytes reassembled to %d bytes", len(data), len(asm.encoded))
+        return False
+    logger.warning("Round trip of %d instructions ok", len(instructions))
+    return not unknown
+
+def main(args):
+    data = open(args.input, "rb").read()
+    if args.roundtrip:
+        if not roundtrip(data, args.address):
+            sys.exit(1)
+        return
+    output = open(args.output, "w") if args.output else sys.stdout
+    with output:
+        for instruction in disassemble(data, args.address):
+            output.write(f"{instruction}\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", help="Output file, default stdout")
+    parser.add_argument("input", help="Input file")
+    parser.add_argument("-a", "--address", type=lambda x: int(x, 0), default=0, help="Address of the first instruction")
+    parser.add_argument("-r", "--roundtrip", action="store_true", default=False, help="Check that assembling the disassembly gives the input again")
+    args = parser.parse_args()
+    main(args)
@@ -1,15 +1,6 @@
 #!/usr/bin/env python3
-import random
+import sys
+from keygen import c_header
 
-random.seed(4) # make deterministic
-
-def gen():
-    return random.choice(range(1, 256, 2))
-
-print("static const uint32_t enc_key[N_WORDS] __attribute__ ((aligned(N_BYTES))) = {")
-
-for i in range(1024):
-      n = gen() | gen() << 8 | gen() << 16 | gen() << 24
-      print(f"\t0x{n:08x},")
-
-print("};")
+# seed 4 keeps the key deterministic, keygen.py generates other seeds and sizes
+sys.stdout.write(c_header(seed=4, size=1024))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+import sys
+from functools import lru_cache
+
+# Bulk version of the key stream of gen_key.py.
+#
+# random.choice(range(1, 256, 2)) draws getrandbits(8) until the value is
+# below 128, which is the top byte of one 32 bit Mersenne Twister output per
+# try. getrandbits(32 * n) returns n consecutive outputs, least significant
+# first, so the draws are every fourth byte of it. Rejected draws are removed
+# and the rest mapped to 2 * d + 1 with bytes.translate, all without a python
+# loop per byte. The key words are the accepted bytes in little endian order.
+#
+# Keys of one seed are prefixes of each other, the stream of a seed is
+# extended on demand and any range of it can be read.
+
+DEFAULT_SEED = 4
+N_WORDS = 1024
+# outputs generated per step, about two tries per accepted byte
+CHUNK_OUTPUTS = 1 << 14
+
+REJECTED = bytes(range(128, 256))
+ODD = bytes(2 * d + 1 for d in range(128)) + bytes(128)
+
+class KeyStream:
+    """Key bytes of one seed, generated in bulk as far as needed"""
+    random: random.Random
+    data: bytearray
+
+    def __init__(self, seed: int):
+        self.random = random.Random(seed)
+        self.data = bytearray()
+
+    def extend(self, size: int):
+        while len(self.data) < size:
+            outputs = self.random.getrandbits(32 * CHUNK_OUTPUTS).to_bytes(4 * CHUNK_OUTPUTS, "little")
+            self.data += outputs[3::4].translate(ODD, REJECTED)
+
+    def words(self, offset: int, count: int) -> bytes:
+        """Words [offset, offset + count) of the stream as little endian bytes"""
+        end = 4 * (offset + count)
+        self.extend(end)
+        return bytes(self.data[4 * offset:end])
+
+@lru_cache(maxsize=None)
+def stream(seed: int) -> KeyStream:
+    return KeyStream(seed)
+
+@lru_cache(maxsize=64)
+def generate(seed: int = DEFAULT_SEED, size: int = N_WORDS) -> bytes:
+    """The first size key words of a seed as little endian bytes"""
+    return stream(seed).words(0, size)
+
+def key_words(seed: int = DEFAULT_SEED, size: int = N_WORDS) -> list[int]:
+    data = generate(seed, size)
+    return [int.from_bytes(data[i:i + 4], "little") for i in range(0, len(data), 4)]
+
+def c_header(seed: int = DEFAULT_SEED, size: int = N_WORDS) -> str:
+    # same text as gen_key.py, main.c defines N_WORDS and N_BYTES
+    lines = ["static const uint32_t enc_key[N_WORDS] __attribute__ ((aligned(N_BYTES))) = {"]
+    lines.extend(f"\t0x{word:08x}," for word in key_words(seed, size))
+    lines.append("};")
+    return "\n".join(lines) + "\n"
+
+def write_npy(output, seed: int = DEFAULT_SEED, size: int = N_WORDS):
+    import numpy as np
+    np.save(output, np.frombuffer(generate(seed, size), dtype="<u4"))
+
+def main(args):
+    if args.format == "npy":
+        if not args.output:
+            sys.exit("npy output needs -o")
+        write_npy(args.output, args.seed, args.words)
+        return
+    if args.format == "bin":
+        data = generate(args.seed, args.words)
+        if args.output:
+            open(args.output, "wb").write(data)
+        else:
+            sys.stdout.buffer.write(data)
+        return
+    header = c_header(args.seed, args.words)
+    if args.output:
+        open(args.output, "w").write(header)
+    else:
+        sys.stdout.write(header)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate the encryption key like gen_key.py")
+    parser.add_argument("-s", "--seed", type=int, default=DEFAULT_SEED, help="Random seed")
+    parser.add_argument("-n", "--words", type=int, default=N_WORDS, help="Number of key words")
+    parser.add_argument("-f", "--format", choices=("c", "bin", "npy"), default="c", help="C header, raw little endian words or numpy array")
+    parser.add_argument("-o", "--output", help="Output file, default stdout")
+    args = parser.parse_args()
+    main(args)
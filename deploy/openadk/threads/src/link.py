@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import os
+from assembler.linker import link
+from assembler.objects import ObjectFile
+from assembler.output import FORMATS
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+def main(args):
+    objects = [ObjectFile.load(path) for path in args.inputs]
+    image, symbols = link(objects)
+    name = args.name or os.path.splitext(os.path.basename(args.output))[0]
+    with open(args.output, "wb") as output:
+        FORMATS[args.format](output, memoryview(image), symbols, name)
+    if args.map:
+        with open(args.map, "w") as output:
+            json.dump(symbols, output, indent=2)
+    logger.info("Linked %d objects, %d bytes", len(objects), len(image))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Link objects written by assembler.py --object into one image")
+    parser.add_argument("inputs", nargs="+", help="Object files, placed in this order")
+    parser.add_argument("-o", "--output", required=True, help="Output image")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="bin", help="Raw image, C header, ELF object with a .minim.text section, Intel HEX or S-records")
+    parser.add_argument("--name", help="Name of the array and prefix of the symbols, default the output file name")
+    parser.add_argument("-m", "--map", help="Write the addresses of the global symbols as JSON to this file")
+    args = parser.parse_args()
+    main(args)
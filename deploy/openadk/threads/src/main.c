@@ -152,8 +152,7 @@ void encrypt(volatile uint32_t *map, uint32_t *t_src, uint32_t *t_dst, const uin
 
     }
     __asm__ volatile (
-        ".incbin \"encrypt.bin\"\n"
-        ".incbin \"minim_disable.bin\"\n"
+        ".incbin \"kernel.bin\"\n"
         ".balign 4\n"
         ::: // MiniM code will clobber these registers
         "D0.0", "D0.2", "D0.3", "D0.4", "D0.5", "D0.6", "D0.7",
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import argparse
+import base64
+import json
+import logging
+import random
+import re
+from assembler import Assembler
+from assembler.registers import REGISTERS
+from assembler.simulator import Simulator
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+N_WORDS = 1024
+N_BYTES = N_WORDS * 4
+N_INPUT_BYTES = N_BYTES // 4 * 3
+
+# buffers are 4k aligned like the memalign calls in main.c
+SRC = 0x1000
+DST = 0x2000
+KEY = 0x3000
+
+def load_key(path: str) -> list[int]:
+    return [int(value, 16) for value in re.findall(r"0x[0-9a-fA-F]{8}", open(path).read())]
+
+def simulate(source: str, plain: bytes, key: list[int], translate: bool = True) -> Simulator:
+    asm = Assembler()
+    asm.assemble(open(source).read())
+    sim = Simulator.from_assembler(asm)
+    sim.translate = translate
+    # the block is base64 encoded into the zeroed src buffer like main.c does
+    encoded = base64.b64encode(plain)
+    sim.memory[SRC:SRC + len(encoded)] = encoded
+    for i, word in enumerate(key):
+        sim.memory[KEY + 4 * i:KEY + 4 * i + 4] = word.to_bytes(4, "little")
+    sim.write(REGISTERS["A0.2"], SRC)
+    sim.write(REGISTERS["A0.3"], DST)
+    sim.write(REGISTERS["A0.4"], KEY)
+    sim.run()
+    return sim
+
+def main(args):
+    if args.input:
+        plain = open(args.input, "rb").read(N_INPUT_BYTES)
+    else:
+        plain = random.Random(args.seed).randbytes(N_INPUT_BYTES)
+    key = load_key(args.key)
+    sim = simulate(args.source, plain, key, not args.no_translate)
+    report = sim.report()
+    for name, stats in report["regions"].items():
+        logger.warning("%-12s %10d instructions %10d cycles", name, stats["instructions"], stats["cycles"])
+    logger.warning("%-12s %10d instructions %10d cycles", "total", report["instructions"], report["cycles"])
+    if args.output:
+        with open(args.output, "wb") as output:
+            output.write(sim.memory[DST:DST + N_BYTES])
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the encryption kernel in the simulator and count instructions and cycles per label")
+    parser.add_argument("source", nargs="?", default="encrypt.s", help="Assembly source of the kernel")
+    parser.add_argument("-i", "--input", help="Plain text block, random if not given")
+    parser.add_argument("-k", "--key", default="enc_key.h", help="Key header")
+    parser.add_argument("-o", "--output", help="Write the encrypted block to this file")
+    parser.add_argument("--json", help="Write the counts as JSON to this file")
+    parser.add_argument("--no-translate", action="store_true", default=False, help="Execute instruction by instruction instead of in translated basic blocks")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed for the random plain text")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import argparse
+import base64
+import multiprocessing
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+import numpy as np
+
+# Same algorithm as decrypt.c, vectorised over many blocks with numpy.
+#
+# Files are split into tasks of CHUNK_BLOCKS blocks which a process pool
+# decrypts independently. Every full block decodes to N_INPUT_BYTES, so each
+# task writes its part of the output at a known offset. The tables are built
+# once and shared with the workers through shared memory.
+#
+# Instead of the 2 GiB CMulMap the complex multiplication is inverted
+# algebraically. With key k = c + di the encryption computed out = in * k mod
+# 256. Multiplying with the conjugate gives out * (c - di) = in * (c^2 + d^2).
+# Key bytes are odd, so c^2 + d^2 = 2m with m odd and, since all input bytes
+# are base64 characters below 128, in = (out * (c - di) / 2) * m^-1 mod 128.
+
+N_WORDS = 1024
+N_BYTES = N_WORDS << 2
+N_INPUT_BYTES = N_BYTES // 4 * 3
+ROUNDS = 20
+ADDRESS_BITS = 12
+# blocks per task, bounds the memory use of each worker
+CHUNK_BLOCKS = 256
+# seconds between progress updates
+PROGRESS_INTERVAL = 0.5
+
+def load_key(path: str) -> np.ndarray:
+    words = [int(value, 16) for value in re.findall(r"0x[0-9a-fA-F]{8}", open(path).read())]
+    if len(words) != N_WORDS:
+        sys.exit(f"Expected {N_WORDS} key words in {path}, found {len(words)}")
+    return np.array(words, dtype="<u4")
+
+def multiplicative_inverse(a: np.ndarray) -> np.ndarray:
+    # newton iteration doubling the correct bits, see decrypt.c
+    x = (3 * a) ^ 2
+    for _ in range(4):
+        x *= 2 - a * x
+    return x
+
+def bitreverse(values: np.ndarray, bits: int) -> np.ndarray:
+    result = np.zeros_like(values)
+    for bit in range(bits):
+        result |= ((values >> bit) & 1) << (bits - 1 - bit)
+    return result
+
+class Decryptor:
+    """Key schedule and inverse tables, optionally placed in shared memory"""
+    key_inverse: np.ndarray
+    key_real: np.ndarray
+    key_imag: np.ndarray
+    norm_inverse: np.ndarray
+    shuffles: np.ndarray
+
+    TABLES = ("key_inverse", "key_real", "key_imag", "norm_inverse", "shuffles")
+
+    def __init__(self, tables: dict[str, np.ndarray]):
+        for name in self.TABLES:
+            setattr(self, name, tables[name])
+
+    @classmethod
+    def from_key(cls, key: np.ndarray) -> "Decryptor":
+        tables = {"key_inverse": multiplicative_inverse(key)}
+        key = key.view(np.uint8).reshape(N_WORDS, 4).astype(np.int32)
+        # real parts in bytes 3 and 2, imaginary parts in bytes 1 and 0
+        real, imag = tables["key_real"], tables["key_imag"] = key[:, 2:].copy(), key[:, :2].copy()
+        m = ((real ** 2 + imag ** 2) & 0xff) >> 1
+        inverses = np.array([pow(x, -1, 128) if x & 1 else 0 for x in range(128)], dtype=np.int32)
+        tables["norm_inverse"] = inverses[m]
+        # the shuffle of round r stored byte k at bitreverse(r + k), undone by a gather
+        tables["shuffles"] = np.stack([
+            bitreverse((start + np.arange(N_BYTES)) % N_BYTES, ADDRESS_BITS)
+            for start in range(ROUNDS)
+            ])
+        return cls(tables)
+
+    def share(self) -> tuple[SharedMemory, list]:
+        """Copy the tables to shared memory, workers attach with the layout"""
+        tables = [getattr(self, name) for name in self.TABLES]
+        shm = SharedMemory(create=True, size=sum(table.nbytes for table in tables))
+        layout = []
+        offset = 0
+        for name, table in zip(self.TABLES, tables):
+            shared = np.ndarray(table.shape, table.dtype, shm.buf, offset)
+            shared[...] = table
+            setattr(self, name, shared)
+            layout.append((name, table.dtype.str, table.shape, offset))
+            offset += table.nbytes
+        return shm, layout
+
+    @classmethod
+    def attach(cls, shm: SharedMemory, layout: list) -> "Decryptor":
+        return cls({name: np.ndarray(shape, dtype, shm.buf, offset) for name, dtype, shape, offset in layout})
+
+    def complex_divide(self, blocks: np.ndarray) -> np.ndarray:
+        data = blocks.view(np.uint8).reshape(-1, N_WORDS, 4).astype(np.int32)
+        real, imag = data[..., 2:], data[..., :2]
+        result = np.empty_like(data)
+        result[..., 2:] = (((real * self.key_real + imag * self.key_imag) & 0xff) >> 1) * self.norm_inverse
+        result[..., :2] = (((imag * self.key_real - real * self.key_imag) & 0xff) >> 1) * self.norm_inverse
+        result &= 0x7f
+        return result.astype(np.uint8).view("<u4").reshape(blocks.shape)
+
+    def decrypt(self, blocks: np.ndarray) -> np.ndarray:
+        """Decrypt (n, N_WORDS) dst blocks back to the base64 src blocks"""
+        dst = np.ascontiguousarray(blocks, dtype="<u4")
+        for i in reversed(range(ROUNDS)):
+            src = dst * self.key_inverse
+            # round i stored the output of the previous one shuffled by SHUFFLES[i]
+            dst = np.take(src.view(np.uint8), self.shuffles[i], axis=1).view("<u4")
+        return self.complex_divide(dst)
+
+def decode(blocks: np.ndarray) -> bytes:
+    """Base64 decode decrypted blocks, only the last may be partial"""
+    data = blocks.tobytes()
+    if data[-1] != 0:
+        return base64.b64decode(data)
+    # the base64 text ends at the zero padding of the block
+    return base64.b64decode(data.split(b"\0", 1)[0])
+
+@dataclass
+class Task:
+    """Blocks [start, start + count) of one file"""
+    path: Path
+    output: Path
+    start: int
+    count: int
+
+def blocks(path: Path) -> int:
+    size = path.stat().st_size
+    if size % N_BYTES:
+        sys.exit(f"{path} is not a multiple of {N_BYTES} bytes")
+    return size // N_BYTES
+
+def decrypt_task(decryptor: Decryptor, task: Task) -> int:
+    encrypted = np.memmap(task.path, dtype="<u4", mode="r", offset=task.start * N_BYTES, shape=(task.count, N_WORDS))
+    decoded = decode(decryptor.decrypt(encrypted))
+    # full blocks decode to N_INPUT_BYTES each, so every task knows its offset
+    fd = os.open(task.output, os.O_WRONLY)
+    try:
+        os.pwrite(fd, decoded, task.start * N_INPUT_BYTES)
+    finally:
+        os.close(fd)
+    return task.count * N_BYTES
+
+worker_decryptor = None
+worker_shm = None
+
+def init_worker(name: str, layout: list):
+    global worker_decryptor, worker_shm
+    worker_shm = SharedMemory(name)
+    worker_decryptor = Decryptor.attach(worker_shm, layout)
+
+def run_task(task: Task) -> int:
+    return decrypt_task(worker_decryptor, task)
+
+def inputs(paths: list[str]) -> list[tuple[Path, Path]]:
+    """Encrypted files with their path relative to the given directory"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend((file, file.relative_to(path)) for file in sorted(path.rglob("*.enc")))
+        else:
+            files.append((path, Path(path.name)))
+    return files
+
+def plan(files: list[tuple[Path, Path]], output: str | None) -> list[Task]:
+    """Create the output files and split the inputs into tasks"""
+    tasks = []
+    for path, relative in files:
+        name = path.name.removesuffix(".enc")
+        target = Path(output) / relative.with_name(name) if output else path.with_name(name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # empty files are encrypted to empty files and need no task
+        target.write_bytes(b"")
+        count = blocks(path)
+        for start in range(0, count, CHUNK_BLOCKS):
+            tasks.append(Task(path, target, start, min(CHUNK_BLOCKS, count - start)))
+    return tasks
+
+class Progress:
+    total: int
+    done: int
+    start: float
+    last: float
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.start = self.last = time.monotonic()
+
+    def update(self, size: int):
+        self.done += size
+        now = time.monotonic()
+        if now - self.last >= PROGRESS_INTERVAL or self.done == self.total:
+            self.last = now
+            print(f"\r{self.done / (1 << 20):.1f}/{self.total / (1 << 20):.1f} MiB {self.throughput():.1f} MiB/s", end="", file=sys.stderr, flush=True)
+
+    def throughput(self) -> float:
+        return self.done / max(time.monotonic() - self.start, 1e-9) / (1 << 20)
+
+def main(args):
+    decryptor = Decryptor.from_key(load_key(args.key))
+    files = inputs(args.inputs)
+    tasks = plan(files, args.output)
+    progress = Progress(sum(task.count for task in tasks) * N_BYTES)
+    if args.jobs == 1:
+        for task in tasks:
+            progress.update(decrypt_task(decryptor, task))
+    else:
+        shm, layout = decryptor.share()
+        try:
+            with multiprocessing.Pool(args.jobs, init_worker, (shm.name, layout)) as pool:
+                for size in pool.imap_unordered(run_task, tasks):
+                    progress.update(size)
+        finally:
+            shm.close()
+            shm.unlink()
+    if tasks:
+        print(file=sys.stderr)
+    print(f"Decrypted {len(files)} files, {progress.done / (1 << 20):.1f} MiB at {progress.throughput():.1f} MiB/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Decrypt files encrypted by threads")
+    parser.add_argument("inputs", nargs="+", help="Encrypted files or directories searched recursively for .enc files")
+    parser.add_argument("-k", "--key", default="enc_key.h", help="Key header")
+    parser.add_argument("-o", "--output", help="Output directory, the input paths are recreated inside. Default next to the input")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes")
+    args = parser.parse_args()
+    main(args)